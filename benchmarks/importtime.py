@@ -0,0 +1,99 @@
+"""Measure how long the pixie CLI spends importing modules per subcommand.
+
+    python benchmarks/importtime.py [--check]
+
+Each command runs in a fresh interpreter with ``python -X importtime``.
+With --check the script exits non-zero when a command goes over the
+startup budget or imports one of the heavy SDKs, which should only be
+imported by the steps that use them.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+
+BUDGET_US = 500000
+
+HEAVY_MODULES = (
+    'boto3',
+    'botocore',
+    'git',
+    'giturlparse',
+    'github',
+    'inquirer',
+    'requests',
+)
+
+COMMANDS = {
+    'version': (['--version'], {}),
+    'run': (['run', '--help'], {}),
+    'info': (['info', '--help'], {}),
+    'discover': (['discover', '--help'], {}),
+    'prefetch': (['prefetch', '--help'], {}),
+    'complete': ([], {
+        '_PIXIE_COMPLETE': 'bash_complete',
+        'COMP_WORDS': 'pixie run ',
+        'COMP_CWORD': '2',
+    }),
+}
+
+CLI_CODE = 'import sys; from pixie.cli import cli; cli(sys.argv[1:], prog_name="pixie")'
+
+
+def measure(args, env=None):
+    """Used to return the import time (in us) and modules imported by a command."""
+
+    proc_env = dict(os.environ, **(env or {}))
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CLI_CODE] + args,
+        env=proc_env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+
+    total = 0
+    modules = []
+    started = False
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        module = name.strip()
+        # interpreter startup (site and .pth files) is not ours to budget
+        if not started:
+            started = module == 'site'
+            continue
+        modules.append(module)
+        if len(name) - len(name.lstrip()) == 1:
+            total += int(parts[1])
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure pixie CLI import time.')
+    parser.add_argument('--check', action='store_true', help='Fail when a command is over budget.')
+    args = parser.parse_args()
+
+    failures = []
+    for name, (command, env) in COMMANDS.items():
+        total, modules = measure(command, env)
+        heavy = sorted({m for m in modules if m.split('.')[0] in HEAVY_MODULES})
+        print(f'{name:<10} {total / 1000:8.1f} ms  {len(modules):4} modules')
+        if total > BUDGET_US:
+            failures.append(f'{name}: {total / 1000:.1f} ms is over the {BUDGET_US / 1000:.0f} ms budget')
+        if heavy:
+            failures.append(f'{name}: imports {", ".join(heavy)}')
+
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import logging
+import threading
+from collections import OrderedDict
+
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_MAX_CLIENTS = 32
+
+_sessions = OrderedDict()
+_clients = OrderedDict()
+_lock = threading.Lock()
+_max_clients = DEFAULT_MAX_CLIENTS
+
+
+def set_max_clients(max_clients):
+    """Used to change how many sessions and clients are kept."""
+
+    global _max_clients
+    with _lock:
+        _max_clients = max(int(max_clients), 1)
+        trim(_sessions)
+        trim(_clients)
+
+
+def trim(cache):
+    while len(cache) > _max_clients:
+        cache.popitem(last=False)
+
+
+def get_session_key(credentials):
+    return tuple(sorted(
+        (name, value) for name, value in (credentials or {}).items() if value is not None
+    ))
+
+
+def get_session(credentials=None):
+    """Used to get a shared boto3 session for a set of Session arguments.
+
+    credentials holds boto3.Session keyword arguments (keys, profile_name,
+    region_name, ...).
+    """
+
+    import boto3
+
+    key = get_session_key(credentials)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            _log.debug('creating aws session for %s', [name for name, _ in key])
+            session = _sessions[key] = boto3.Session(**dict(key))
+        _sessions.move_to_end(key)
+        trim(_sessions)
+        return session
+
+
+def get_client(service_name, credentials=None):
+    """Used to get a shared boto3 client.
+
+    Clients are cached per service and session arguments. boto3 clients
+    are thread safe, so parallel steps share them. Sessions are not, so
+    clients are created under a lock.
+    """
+
+    key = (service_name, get_session_key(credentials))
+    with _lock:
+        client = _clients.get(key)
+        if client is not None:
+            _clients.move_to_end(key)
+            return client
+
+    session = get_session(credentials)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            _log.debug('creating aws %s client', service_name)
+            client = _clients[key] = session.client(service_name)
+        _clients.move_to_end(key)
+        trim(_clients)
+        return client
+
+
+def clear_clients():
+    with _lock:
+        _sessions.clear()
+        _clients.clear()
@@ -6,8 +6,8 @@ import logging
 from termcolor import colored
 
 from . import __version__
-from . import engine, utils
-from .config import PixieConfig
+from . import completion, utils
+from .config import PixieConfig, get_user_config_file
 from .context import PixieContext
 from .runtime import PixieConsoleRuntime
 
@@ -28,52 +28,52 @@ class AddColorFormatter(logging.Formatter):
         return color + record.levelname + "\033[1;0m: " + msg
 
 
-def get_aliases():
-    config = PixieConfig.from_user()
+def get_runtime(config: PixieConfig):
+    options = click.get_current_context().find_root().obj or {}
+    return PixieConsoleRuntime(
+        config,
+        offline=options.get('offline', False),
+        refresh=options.get('refresh', False)
+    )
 
-    library = config.get('library', {})
 
-    aliases = []
-    for package_name in library:
-        package = library[package_name]
-        for alias_name in package:
-            aliases.append(alias_name)
-    return aliases
+def get_completion_index():
+    config_file = get_user_config_file()
+    index = completion.load_index(config_file=config_file)
+    if index is None:
+        config = PixieConfig.from_user()
+        index = completion.save_index(config.get('library', {}))
+    return index
 
 
-def get_library_packages():
-    config = PixieConfig.from_user()
-    library = config.get('library', {})
+def get_aliases():
+    return get_completion_index()['aliases']
 
-    package_names = []
-    for package_name in library:
-        package_names.append(package_name)
-    return package_names
+
+def get_library_packages():
+    return get_completion_index()['packages']
 
 
 def complete_library_packages(ctx, param, incomplete):
-    package_names = list(get_library_packages())
-    return [
-        name for name in package_names if name.startswith(incomplete)
-    ]
+    return completion.complete(get_library_packages(), incomplete)
 
 
 def complete_library_aliases(ctx, param, incomplete):
-    aliases = list(get_aliases())
-    return [
-        name for name in aliases if name.startswith(incomplete)
-    ]
+    return completion.complete(get_aliases(), incomplete)
 
 
 @click.command("discover", help="Discover pixies in a package.")
 @click.argument('package', default='.', type=click.Path(), shell_complete=complete_library_packages)
 @click.option('-s', '--save', is_flag=True, help='Path to the pixie script.')
-def discover_cli(package, save):
+@click.option('-j', '--jobs', default=1, type=int, help='Number of scripts to parse at once.')
+def discover_cli(package, save, jobs):
+    from . import engine
+
     config = PixieConfig.from_user()
     library = config.get('library', {})
 
-    runtime = PixieConsoleRuntime(config)
-    package_info = engine.discover(runtime, {}, package)
+    runtime = get_runtime(config)
+    package_info = engine.discover(runtime, {}, package, jobs)
     aliases = package_info['aliases']
     library[package] = aliases
     config['library'] = library
@@ -85,6 +85,7 @@ def discover_cli(package, save):
     
     if save:
         config.save_user()
+        completion.save_index(library)
         click.echo('\n' + colored('Saved to ' + config.file, "grey"))
 
 
@@ -106,6 +107,8 @@ def list_cli():
 @click.option('-p', '--package', default='.', type=click.Path(), help='Pixie package name.', shell_complete=complete_library_packages)
 @click.option('-s', '--script', default='.pixie.yaml', type=click.Path(), help='Path to the pixie script.')
 def info_cli(job, package, script):
+    from . import engine
+
     config = PixieConfig.from_user()
     library = config.get('library', {})
 
@@ -118,7 +121,7 @@ def info_cli(job, package, script):
             job = job_alias['job']
             break
     
-    runtime = PixieConsoleRuntime(config)
+    runtime = get_runtime(config)
     actual_job = engine.get_job(dict(
         package=package,
         job=job,
@@ -145,6 +148,36 @@ def info_cli(job, package, script):
         click.echo('\nParameters: None')
 
 
+@click.command("prefetch", help="Fetch all packages used by a job.")
+@click.argument('job', shell_complete=complete_library_aliases)
+@click.option('-p', '--package', default='.', type=click.Path(), help='Pixie package name.', shell_complete=complete_library_packages)
+@click.option('-s', '--script', default='.pixie.yaml', type=click.Path(), help='Path to the pixie script.')
+def prefetch_cli(job, package, script):
+    from . import engine
+
+    config = PixieConfig.from_user()
+    library = config.get('library', {})
+
+    for package_name in library:
+        lib_pkg = library[package_name]
+        if job in lib_pkg:
+            job_alias = lib_pkg[job]
+            script = job_alias['script']
+            package = job_alias['package']
+            job = job_alias['job']
+            break
+
+    runtime = get_runtime(config)
+    fetched = engine.prefetch(runtime, dict(
+        package=package,
+        job=job,
+        script=script
+    ))
+
+    for package_name in fetched:
+        click.echo('📦 ' + colored(package_name, 'green'))
+
+
 @click.command("completion", help="Return shell completion script.")
 @click.argument('shell')
 def completion_cli(shell: str):
@@ -160,6 +193,8 @@ def completion_cli(shell: str):
 @click.option('--context-from', type=click.Path(), help='File used to set context')
 @click.option('-t', '--target', default='.', type=click.Path(), help='Directory to use when generating files')
 def run_cli(job, package, script, context, context_from, target):
+    from . import engine
+
     config = PixieConfig.from_user()
 
     library = config.get('library', {})
@@ -206,14 +241,19 @@ def run_cli(job, package, script, context, context_from, target):
             'job': job,
             'package': package,
             'context': ctx
-        }, PixieConsoleRuntime(config))
+        }, get_runtime(config))
     except KeyboardInterrupt:
         pass
 
 @click.group(context_settings=dict(help_option_names=['-h', '--help']))
 @click.version_option(__version__)
 @click.option('--log-level', default='info', help='The log level to output (debug, info, warning, error)')
-def cli(log_level):
+@click.option('--offline', is_flag=True, help='Only use packages that are already cached.')
+@click.option('--refresh', is_flag=True, help='Pull cached packages even if they are still fresh.')
+@click.pass_context
+def cli(ctx, log_level, offline, refresh):
+    ctx.obj = dict(offline=offline, refresh=refresh)
+
     stdout_hdlr = logging.StreamHandler(stream=sys.stdout)
     stdout_hdlr.setFormatter(AddColorFormatter())
 
@@ -231,6 +271,7 @@ cli.add_command(run_cli)
 cli.add_command(discover_cli)
 cli.add_command(list_cli)
 cli.add_command(info_cli)
+cli.add_command(prefetch_cli)
 cli.add_command(completion_cli)
 
 
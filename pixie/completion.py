@@ -0,0 +1,64 @@
+import bisect
+import json
+import logging
+import os
+
+from .utils import write_atomic
+
+
+_log = logging.getLogger(__name__)
+
+
+def get_index_file():
+    return os.path.realpath(os.path.expanduser('~/.pixie/cache/completion.json'))
+
+
+def build_index(library):
+    """Used to build the sorted alias and package tables used for completion."""
+
+    aliases = set()
+    for package_name in library:
+        aliases.update(library[package_name])
+    return dict(
+        aliases=sorted(aliases),
+        packages=sorted(library)
+    )
+
+
+def save_index(library, path=None):
+    path = path or get_index_file()
+    index = build_index(library)
+    try:
+        write_atomic(path, lambda fhd: json.dump(index, fhd))
+    except OSError as ex:
+        _log.debug('failed to write completion index %s: %s', path, ex)
+    return index
+
+
+def load_index(path=None, config_file=None):
+    """Used to read the completion index, or None when it is missing or stale.
+
+    The index is stale when the config file it was built from changed
+    after it was written.
+    """
+
+    path = path or get_index_file()
+    try:
+        index_mtime = os.stat(path).st_mtime_ns
+        if config_file and os.path.exists(config_file) and os.stat(config_file).st_mtime_ns > index_mtime:
+            return None
+        with open(path, 'r') as fhd:
+            return json.load(fhd)
+    except (OSError, ValueError):
+        return None
+
+
+def complete(names, prefix):
+    """Used to return the names in a sorted list that start with prefix."""
+
+    matches = []
+    for idx in range(bisect.bisect_left(names, prefix), len(names)):
+        if not names[idx].startswith(prefix):
+            break
+        matches.append(names[idx])
+    return matches
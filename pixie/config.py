@@ -8,12 +8,16 @@ from . import utils
 _log = getLogger(__name__)
 
 
+def get_user_config_file():
+    return os.path.realpath(os.path.expanduser('~/.pixie/config.yaml'))
+
+
 class PixieConfig(dict):
     file: str
 
     @staticmethod
     def from_user():
-        config_file = os.path.realpath(os.path.expanduser('~/.pixie/config.yaml'))
+        config_file = get_user_config_file()
         config = PixieConfig.from_file(config_file)
         config.file = config_file
         return config
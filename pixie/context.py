@@ -1,5 +1,6 @@
 import os
 
+from collections import ChainMap
 from typing import Dict, List
 
 
@@ -35,3 +36,14 @@ class PixieContext(dict):
     
     def set_step(self, step_id, value):
         self['steps'][step_id] = value
+
+    def child(self):
+        """Used to copy the context for steps that run in isolation.
+
+        The child sees the parent's step results, but records its own in a
+        separate layer.
+        """
+
+        child = PixieContext(self)
+        child['steps'] = ChainMap({}, self['steps'])
+        return child
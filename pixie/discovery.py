@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+
+from .scripts import load_script
+from .utils import write_atomic
+
+
+_log = logging.getLogger(__name__)
+
+SCRIPT_NAME = '.pixie.yaml'
+
+SKIP_DIRS = {
+    '.git',
+    '.hg',
+    '.svn',
+    '.tox',
+    '.venv',
+    '__pycache__',
+    'node_modules',
+    'venv',
+}
+
+
+def get_manifest_file(pkg_dir):
+    cache_dir = os.path.realpath(os.path.expanduser('~/.pixie/cache/discover'))
+    digest = hashlib.sha1(os.path.realpath(pkg_dir).encode()).hexdigest()
+    return os.path.join(cache_dir, digest + '.json')
+
+
+def read_gitignore(path, base):
+    """Used to read the directory patterns of a .gitignore file.
+
+    Returns (base, pattern) pairs; negations are not supported.
+    """
+
+    patterns = []
+    try:
+        with open(path, 'r') as fhd:
+            lines = fhd.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return patterns
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#') or line.startswith('!'):
+            continue
+        patterns.append((base, line.rstrip('/')))
+    return patterns
+
+
+def is_ignored(rel_path, name, patterns):
+    for base, pattern in patterns:
+        if base:
+            if not rel_path.startswith(base + '/'):
+                continue
+            path = rel_path[len(base) + 1:]
+        else:
+            path = rel_path
+        if '/' in pattern:
+            if fnmatch(path, pattern.lstrip('/')):
+                return True
+        elif fnmatch(name, pattern):
+            return True
+    return False
+
+
+def find_scripts(pkg_dir):
+    """Used to find pixie scripts, skipping VCS, dependency and ignored directories."""
+
+    scripts = []
+    ignore_patterns = []
+    for dir_path, dir_names, file_names in os.walk(pkg_dir):
+        rel_dir = os.path.relpath(dir_path, pkg_dir)
+        rel_dir = '' if rel_dir == '.' else rel_dir.replace(os.sep, '/')
+        if '.gitignore' in file_names:
+            ignore_patterns.extend(read_gitignore(os.path.join(dir_path, '.gitignore'), rel_dir))
+
+        kept = []
+        for name in dir_names:
+            rel_path = f'{rel_dir}/{name}' if rel_dir else name
+            if name in SKIP_DIRS or is_ignored(rel_path, name, ignore_patterns):
+                continue
+            kept.append(name)
+        dir_names[:] = sorted(kept)
+
+        if SCRIPT_NAME in file_names:
+            scripts.append(f'{rel_dir}/{SCRIPT_NAME}' if rel_dir else SCRIPT_NAME)
+    return scripts
+
+
+def read_script_entry(pkg_dir, script, cache_dir=None):
+    path = os.path.join(pkg_dir, script)
+    stat = os.stat(path)
+    pixie_config = load_script(path, cache_dir) or {}
+    jobs = pixie_config.get('jobs') or {}
+    return dict(
+        mtime_ns=stat.st_mtime_ns,
+        size=stat.st_size,
+        name=pixie_config.get('name'),
+        jobs={job_name: (jobs[job_name] or {}).get('description', '') for job_name in jobs}
+    )
+
+
+def read_manifest(manifest_file):
+    try:
+        with open(manifest_file, 'r') as fhd:
+            return json.load(fhd)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(manifest_file, manifest):
+    try:
+        write_atomic(manifest_file, lambda fhd: json.dump(manifest, fhd))
+    except OSError as ex:
+        _log.debug('failed to write discover manifest %s: %s', manifest_file, ex)
+
+
+def scan_package(pkg_dir, manifest_file=None, max_workers=None, cache_dir=None):
+    """Used to read the name and jobs of every pixie script in a package.
+
+    When a manifest file is given, scripts whose mtime and size match the
+    manifest are not parsed again. Changed scripts are parsed on a thread
+    pool when max_workers is more than one.
+    """
+
+    manifest = read_manifest(manifest_file) if manifest_file else {}
+    entries = {}
+    changed = []
+    for script in find_scripts(pkg_dir):
+        entry = manifest.get(script)
+        if entry is not None:
+            stat = os.stat(os.path.join(pkg_dir, script))
+            if entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                entries[script] = entry
+                continue
+        changed.append(script)
+
+    _log.debug('discover: %s unchanged, %s changed scripts', len(entries), len(changed))
+    if max_workers and max_workers > 1 and len(changed) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pixie-discover') as pool:
+            results = pool.map(lambda script: read_script_entry(pkg_dir, script, cache_dir), changed)
+            entries.update(zip(changed, results))
+    else:
+        for script in changed:
+            entries[script] = read_script_entry(pkg_dir, script, cache_dir)
+
+    entries = {script: entries[script] for script in sorted(entries)}
+    if manifest_file and (changed or len(entries) != len(manifest)):
+        write_manifest(manifest_file, entries)
+    return entries
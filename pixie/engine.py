@@ -9,17 +9,19 @@ import pathlib
 import re
 import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
 
-from git import Repo
 from ruamel.yaml import YAML
 
 from .steps import PixieStepExecution
 from .context import PixieContext
 from .plugin import PixiePluginContext
-from .plugins import load_plugins
-from .rendering import render_options, render_text, render_value
+from .packages import DEFAULT_TTL, PixiePackageCache
+from .rendering import find_parameter_names, get_aws_utils, get_bytecode_cache_dir, is_template, render_options, render_text, render_value, set_bytecode_cache
 from .runtime import PixieRuntime, convert
+from .discovery import get_manifest_file, scan_package
+from .scripts import get_cache_dir, load_script
 from . import utils
 
 
@@ -114,17 +116,22 @@ def process_parameters(parameters, context: PixieContext, runtime: PixieRuntime)
 
 
 def run(context: PixieContext, options, runtime: PixieRuntime):
+    configure_caches(runtime)
+    prefetch(runtime, options)
     execute_scaffold(context, options, runtime)
 
     runtime.print_todos(context)
     runtime.print_notes(context)
 
+    # only loaded when a github step ran
+    github = sys.modules.get('pixie.github')
+    if github is not None:
+        _log.debug('github requests: %s', github.metrics.as_dict())
+
     return context
 
 
 def get_job(options, runtime):
-    yaml = YAML()
-
     script = options.get('script', '.pixie.yaml')
 
     package = options['package']
@@ -141,8 +148,7 @@ def get_job(options, runtime):
 
     job_name = options.get('job', 'default')
     if scaffold_file is not None:
-        with open(scaffold_file, 'r') as fhd:
-            config = yaml.load(fhd)
+        config = load_script(scaffold_file, get_script_cache_dir(runtime))
     else:
         config = {
             'jobs': {
@@ -172,8 +178,6 @@ def get_job(options, runtime):
 def execute_scaffold(context: PixieContext, options, runtime: PixieRuntime):
     package = options['package']
 
-    yaml = YAML()
-
     script = options.get('script', '.pixie.yaml')
 
     if '__package' in context:
@@ -195,8 +199,7 @@ def execute_scaffold(context: PixieContext, options, runtime: PixieRuntime):
 
     job_name = options.get('job', 'default')
     if scaffold_file is not None:
-        with open(scaffold_file, 'r') as fhd:
-            config = yaml.load(fhd)
+        config = load_script(scaffold_file, get_script_cache_dir(runtime))
     elif job_name == 'scaffold':
         config = {
             'jobs': {
@@ -224,9 +227,8 @@ def execute_scaffold(context: PixieContext, options, runtime: PixieRuntime):
 
     step_execution = PixieStepExecution(plugin_context)
 
-    plugins: list = load_plugins()
-    for plugin in plugins:
-        plugin.init(plugin_context)
+    job = config.get('jobs', {}).get(job_name, {})
+    prefetch_parameter_names(config, job)
 
     context_options = render_options(config.get('context', {}), context)
     context.update(context_options)
@@ -240,41 +242,98 @@ def execute_scaffold(context: PixieContext, options, runtime: PixieRuntime):
     }
 
     steps_context = context['steps'] = {}
-    job = config.get('jobs', {}).get(job_name, {})
 
     context_options = render_options(job.get('context', {}), context)
     context.update(context_options)
     process_parameters(job.get('parameters', []), context, runtime)
+    prefetch_ssm_parameters(job, context)
 
     if context.get('__target') is None:
         context['__target'] = os.getcwd()
     
     _log.debug('%s', context)
 
-    steps: list = job.get('steps', [])
+    plan = step_execution.compile(job.get('steps', []))
 
-    step_execution.execute(context, runtime, steps_context, steps)
+    shell_session = None
+    if job.get('shell') == 'persistent':
+        from .shell import ShellSession
+        shell_session = context['__shell'] = ShellSession(context['__target'])
+
+    try:
+        if job.get('strategy') == 'dag':
+            step_execution.execute_graph(context, runtime, steps_context, plan, job.get('parallel'))
+        else:
+            step_execution.execute(context, runtime, steps_context, plan)
+    finally:
+        if shell_session is not None:
+            shell_session.close()
 
     return context
 
 
-def discover(runtime, options, package):
+def prefetch_parameter_names(config, job):
+    """Used to read the literal aws.get_parameter('...') names of the script's
+    and the job's context blocks in as few calls as possible.
+
+    Runs before the context blocks are rendered, so they read the
+    parameters from the memo.
+    """
+
+    names = find_parameter_names([config.get('context', {}), job.get('context', {})])
+    if not names:
+        return
+
+    try:
+        get_aws_utils().prefetch_parameters(names)
+    except Exception as ex:
+        # the templates read them one at a time if they need them
+        _log.debug('failed to prefetch ssm parameters: %s', ex)
+
+
+def prefetch_ssm_parameters(job, context):
+    """Used to read the parameters and paths listed in the job's ssm block.
+
+    The block is rendered once the job's context and parameters are set,
+    so it can use them.
+    """
+
+    ssm = job.get('ssm') or {}
+    if isinstance(ssm, list):
+        ssm = {'parameters': ssm}
+    if not ssm:
+        return
+
+    aws = get_aws_utils()
+    try:
+        ssm = render_options(ssm, context)
+        profile_name = ssm.get('profile_name')
+        for path in ssm.get('paths', []):
+            aws.prefetch_parameters_by_path(path, profile_name)
+        aws.prefetch_parameters(ssm.get('parameters', []), profile_name)
+    except Exception as ex:
+        _log.warning('failed to prefetch ssm parameters: %s', ex)
+
+
+def discover(runtime, options, package, max_workers=None):
     result = {}
     pkg_dir, package_path = fetch_package(runtime, options, package)
-    pkg_dir = pathlib.Path(pkg_dir)
-    for f in pkg_dir.glob('**/.pixie.yaml'):
-        pixie_config = utils.read_yaml(str(f), {})
-        if 'name' in pixie_config:
-            pkg_name = pixie_config['name']
-            jobs = pixie_config.get('jobs')
+
+    cache_config = (runtime.config or {}).get('cache', {})
+    manifest_file = get_manifest_file(pkg_dir) if cache_config.get('discover', True) else None
+    scripts = scan_package(pkg_dir, manifest_file, max_workers, get_script_cache_dir(runtime))
+
+    for script, entry in scripts.items():
+        if entry['name'] is not None:
+            pkg_name = entry['name']
+            jobs = entry['jobs']
             for job_name in jobs:
-                job = jobs[job_name]
                 alias_name = f'{pkg_name}/{job_name}'
                 result[alias_name] = dict(
                     package=package,
                     job=job_name,
-                    description=job.get('description', ''),
-                    script=str(f.relative_to(pkg_dir))
+                    description=jobs[job_name],
+                    script=script
                 )
     return {
         'aliases': result,
@@ -282,43 +341,113 @@ def discover(runtime, options, package):
     }
 
 
-def fetch_package(runtime, options, package):
+def get_script_cache_dir(runtime):
+    cache_config = (runtime.config or {}).get('cache', {})
+    if not cache_config.get('scripts', True):
+        return None
+    return get_cache_dir()
+
+
+def configure_caches(runtime):
+    cache_config = (runtime.config or {}).get('cache', {})
+    set_bytecode_cache(get_bytecode_cache_dir() if cache_config.get('templates', False) else None)
+
+    aws_config = (runtime.config or {}).get('aws', {})
+    if 'max_clients' in aws_config:
+        from .aws import set_max_clients
+        set_max_clients(aws_config['max_clients'])
 
-    if os.path.exists(package):
-        return package, os.path.realpath(package) + '/'
 
+def get_package_cache(runtime, options):
     packages_dir = os.path.realpath(os.path.expanduser('~/.pixie/packages'))
-    tempdir = options.get('temp', packages_dir)
+    package_config = (runtime.config or {}).get('packages', {})
 
-    package_parts = package.split('@')
-    if len(package_parts) == 1:
-        package_name = package_parts[0]
-        package_version = None
-        package_version_suffix = ''
-    else:
-        package_name = package_parts[0]
-        package_version = package_parts[1]
-        package_version_suffix = '@' + package_version
-    package_name_parts = package_name.split('/')
-    if len(package_name_parts) <= 2:
-        package_name_parts = ['github.com'] + package_name_parts
-        package_name = '/'.join(package_name_parts)
-    pkg_dir = os.path.join(tempdir, f'{package_name}{package_version_suffix}')
-    _log.debug('using package dir: %s', pkg_dir)
-
-    if os.path.exists(pkg_dir):
-        _log.debug('[git] updating %s package', package)
-        repo = Repo(pkg_dir)
-        repo.remotes.origin.pull()
+    return PixiePackageCache(
+        options.get('temp', packages_dir),
+        ttl=package_config.get('ttl', DEFAULT_TTL),
+        offline=runtime.offline,
+        refresh=runtime.refresh
+    )
+
+
+def collect_packages(steps):
+    """Used to collect the literal packages referenced by nested pixie steps."""
+
+    normalize_step = PixieStepExecution(None).normalize_step
+    references = []
+    for step in (steps or []):
+        step = normalize_step(step)
+        if 'group' in step:
+            references.extend(collect_packages(step['group']))
+        elif 'foreach' in step:
+            references.extend(collect_packages(step['foreach'].get('steps', [])))
+        elif step.get('action') == 'pixie':
+            pixie_options = step.get('with', {})
+            package = pixie_options.get('package')
+            if isinstance(package, str) and not is_template(package):
+                references.append(dict(
+                    package=package,
+                    script=pixie_options.get('script', '.pixie.yaml'),
+                    job=pixie_options.get('job', 'default')
+                ))
+    return references
+
+
+def prefetch_job(runtime, options, parent_dir=None):
+    package = options['package']
+    if parent_dir is not None and os.path.exists(os.path.join(parent_dir, package)):
+        pkg_dir = os.path.join(parent_dir, package)
     else:
-        _log.debug('[git] pulling %s package', package_name)
-        repo = Repo.clone_from(
-            f'https://{package_name}',
-            pkg_dir,
-            branch=package_version,
-            depth=1
-        )
-
-    branch = repo.active_branch
-    package_base_url = urljoin(repo.remotes.origin.url + '/', f'blob/{branch}/')
-    return pkg_dir, package_base_url
+        pkg_dir, _ = fetch_package(runtime, options, package)
+
+    scaffold_file = locate_scaffold_file(pkg_dir, options.get('script', '.pixie.yaml'))
+    if scaffold_file is None:
+        return []
+
+    config = load_script(scaffold_file, get_script_cache_dir(runtime)) or {}
+    job = config.get('jobs', {}).get(options.get('job', 'default')) or {}
+
+    pixie_dir = os.path.dirname(scaffold_file)
+    return [(reference, pixie_dir) for reference in collect_packages(job.get('steps', []))]
+
+
+def prefetch(runtime, options, max_workers=8):
+    """Used to fetch every package a job references before it runs.
+
+    The job's steps, and recursively the scripts they reference, are
+    scanned for pixie steps with a literal package, and each level of
+    packages is fetched concurrently. Failures are only logged, since the
+    step that needs the package will report them when it runs.
+    """
+
+    fetched = []
+    seen = set()
+    level = [(options, None)]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pixie-prefetch') as pool:
+        while level:
+            futures = [
+                (job_options, pool.submit(prefetch_job, runtime, job_options, parent_dir))
+                for job_options, parent_dir in level
+            ]
+            level = []
+            for job_options, future in futures:
+                try:
+                    references = future.result()
+                except Exception as ex:
+                    _log.warning('failed to prefetch %s: %s', job_options['package'], ex)
+                    continue
+                fetched.append(job_options['package'])
+                for reference, parent_dir in references:
+                    key = (reference['package'], reference['script'], reference['job'], parent_dir)
+                    if key not in seen:
+                        seen.add(key)
+                        level.append((reference, parent_dir))
+    return fetched
+
+
+def fetch_package(runtime, options, package):
+
+    if os.path.exists(package):
+        return package, os.path.realpath(package) + '/'
+
+    return get_package_cache(runtime, options).fetch(package)
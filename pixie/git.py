@@ -1,6 +1,4 @@
-import os
-
-from ruamel.yaml import YAML
+from .github import get_host_token
 
 
 class GitContext(dict):
@@ -13,12 +11,8 @@ def fetch_token(host, options, context):
     if 'token' in options:
         return options['token']
 
-    gh_hosts = os.path.expanduser('~/.config/gh/hosts.yml')
-    if os.path.exists(gh_hosts):
-        yaml = YAML()
-        with open(gh_hosts, 'r') as f:
-            gh_hosts = yaml.load(f)
-        if host in gh_hosts:
-            return gh_hosts[host]['oauth_token']
-    
+    token = get_host_token(host)
+    if token:
+        return token
+
     return context.environ.get('GITHUB_TOKEN')
@@ -0,0 +1,256 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from ruamel.yaml import YAML
+
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_RETRIES = 10
+ETAG_CACHE_SIZE = 2048
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+def get_hosts_file():
+    return os.path.expanduser('~/.config/gh/hosts.yml')
+
+
+def read_hosts(path=None):
+    """Used to read the gh CLI hosts file, parsing it again only when it changes."""
+
+    path = path or get_hosts_file()
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+
+    with _hosts_lock:
+        entry = _hosts.get(path)
+        if entry is not None and entry[0] == mtime_ns:
+            return entry[1]
+
+    yaml = YAML(typ='safe')
+    with open(path, 'r') as fhd:
+        hosts = yaml.load(fhd) or {}
+    with _hosts_lock:
+        _hosts[path] = (mtime_ns, hosts)
+    return hosts
+
+
+def get_host_token(host, path=None):
+    return (read_hosts(path).get(host) or {}).get('oauth_token')
+
+
+class GithubMetrics:
+    """Counts the requests sent to GitHub and the ones answered from the ETag cache."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.cache_hits = 0
+            self.rate_limit_remaining = None
+
+    def record(self, response, cache_hit=False):
+        with self.lock:
+            self.requests += 1
+            if cache_hit:
+                self.cache_hits += 1
+            remaining = response.headers.get('x-ratelimit-remaining')
+            if remaining is not None:
+                self.rate_limit_remaining = int(remaining)
+
+    def as_dict(self):
+        with self.lock:
+            return dict(
+                requests=self.requests,
+                cache_hits=self.cache_hits,
+                rate_limit_remaining=self.rate_limit_remaining
+            )
+
+
+metrics = GithubMetrics()
+
+
+class EtagCache:
+    """Keeps the last response of GET requests that carried an ETag or Last-Modified."""
+
+    def __init__(self, maxsize=ETAG_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+etag_cache = EtagCache()
+
+
+def get_cache_key(request):
+    authorization = request.headers.get('Authorization', '')
+    return (
+        request.url,
+        request.headers.get('Accept', ''),
+        hashlib.sha256(authorization.encode()).hexdigest()
+    )
+
+
+class ConditionalAdapter(HTTPAdapter):
+    """Sends GETs as conditional requests and answers 304s from the ETag cache.
+
+    GitHub does not count 304 responses against the rate limit.
+    """
+
+    def __init__(self, cache=None, **kwargs) -> None:
+        self.cache = cache if cache is not None else etag_cache
+        super().__init__(**kwargs)
+
+    def send(self, request, stream=False, **kwargs):
+        if request.method != 'GET' or stream:
+            response = super().send(request, stream=stream, **kwargs)
+            metrics.record(response)
+            return response
+
+        key = get_cache_key(request)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        response = super().send(request, stream=stream, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            metrics.record(response, cache_hit=True)
+            headers = CaseInsensitiveDict(entry['headers'])
+            headers.update(
+                (name, value) for name, value in response.headers.items()
+                if name.lower().startswith('x-ratelimit')
+            )
+            response.status_code = 200
+            response.headers = headers
+            response.encoding = entry['encoding']
+            response._content = entry['content']
+            return response
+
+        metrics.record(response)
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.status_code == 200 and (etag or last_modified):
+            self.cache.set(key, dict(
+                etag=etag,
+                last_modified=last_modified,
+                headers=dict(response.headers),
+                encoding=response.encoding,
+                content=response.content
+            ))
+        return response
+
+
+@lru_cache(maxsize=None)
+def get_connection_class():
+    from github.Requester import HTTPSRequestsConnectionClass
+
+    class CachingConnection(HTTPSRequestsConnectionClass):
+        """A PyGithub connection that uses the ConditionalAdapter.
+
+        PyGithub keeps one connection per client and passes each request
+        through request() and getresponse(). The request is kept per thread
+        so that threads can share a client.
+        """
+
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            self.local = threading.local()
+            self.adapter = ConditionalAdapter(
+                max_retries=self.retry,
+                pool_connections=self.pool_size,
+                pool_maxsize=self.pool_size
+            )
+            self.session.mount('https://', self.adapter)
+
+        def request(self, verb, url, input, headers, stream=False):
+            self.local.request = (verb, url, input, headers)
+
+        def getresponse(self):
+            from github.Requester import RequestsResponse
+
+            verb, url, input, headers = self.local.request
+            response = self.session.request(
+                verb,
+                f'{self.protocol}://{self.host}:{self.port}{url}',
+                headers=headers,
+                data=input,
+                timeout=self.timeout,
+                verify=self.verify,
+                allow_redirects=False
+            )
+            return RequestsResponse(response)
+
+    return CachingConnection
+
+
+def get_client(base_url, token=None, pool_size=DEFAULT_POOL_SIZE):
+    """Used to get a shared PyGithub client per base url and token.
+
+    Clients keep a pool of pool_size connections and back off on primary
+    and secondary rate limits with GithubRetry. GET requests over https go
+    through the ETag cache.
+    """
+
+    from github import Auth, Github, GithubRetry
+
+    key = (base_url, hashlib.sha256((token or '').encode()).hexdigest(), pool_size)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            _log.debug('creating github client for %s', base_url)
+            client = Github(
+                auth=Auth.Token(token) if token else None,
+                base_url=base_url,
+                retry=GithubRetry(total=DEFAULT_RETRIES),
+                pool_size=pool_size
+            )
+            requester = client.requester
+            if base_url.startswith('https://') and hasattr(requester, '_Requester__connectionClass'):
+                # per client, since Requester.injectConnectionClasses turns off connection reuse
+                requester._Requester__connectionClass = get_connection_class()
+            _clients[key] = client
+        return client
+
+
+def clear_clients():
+    with _clients_lock:
+        _clients.clear()
+    etag_cache.clear()
@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from urllib.parse import urljoin
+
+from .utils import write_atomic
+
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 3600
+
+SYMLINK_MODE = 0o120000
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+# mirrors fetched by this process, which count as fresh until it exits
+_fetched_mirrors = set()
+
+
+def get_lock(key):
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def parse_package(package: str):
+    """Used to split a package reference into its full name and version."""
+
+    package_parts = package.split('@')
+    package_name = package_parts[0]
+    package_version = package_parts[1] if len(package_parts) > 1 else None
+
+    package_name_parts = package_name.split('/')
+    if len(package_name_parts) <= 2:
+        package_name_parts = ['github.com'] + package_name_parts
+        package_name = '/'.join(package_name_parts)
+    return package_name, package_version
+
+
+class PixiePackageCache:
+    """Keeps packages in a content-addressed store and decides when to fetch them.
+
+    The store holds one bare mirror per repository (mirrors/), every file
+    blob once (objects/) and one exported tree per commit (trees/), whose
+    files are hard links to the blobs. Switching to a version that is
+    already in the mirror is a local operation.
+
+    Unpinned packages are fetched once the mirror's last fetch is older
+    than the ttl (in seconds). Packages pinned with @version are only
+    fetched when the version is missing from the mirror.
+    """
+
+    def __init__(self, packages_dir: str, ttl=DEFAULT_TTL, offline=False, refresh=False) -> None:
+        self.packages_dir = packages_dir
+        self.ttl = ttl
+        self.offline = offline
+        self.refresh = refresh
+
+    def get_mirror_dir(self, package_name):
+        return os.path.join(self.packages_dir, 'mirrors', f'{package_name}.git')
+
+    def get_tree_dir(self, commit):
+        return os.path.join(self.packages_dir, 'trees', commit)
+
+    def get_object_path(self, hexsha, mode):
+        suffix = '.x' if mode & stat.S_IXUSR else ''
+        return os.path.join(self.packages_dir, 'objects', hexsha[:2], hexsha[2:] + suffix)
+
+    def read_metadata(self, mirror_dir):
+        try:
+            with open(mirror_dir + '.json', 'r') as fhd:
+                return json.load(fhd)
+        except (OSError, ValueError):
+            return {}
+
+    def write_metadata(self, mirror_dir, metadata):
+        with open(mirror_dir + '.json', 'w') as fhd:
+            json.dump(metadata, fhd)
+        return metadata
+
+    def is_stale(self, metadata):
+        fetched_at = metadata.get('fetched_at')
+        if fetched_at is None:
+            return True
+        return time.time() - fetched_at >= self.ttl
+
+    def resolve_commit(self, repo, package_version):
+        try:
+            return repo.commit(package_version or 'HEAD')
+        except Exception as ex:
+            _log.debug(ex)
+        return None
+
+    def store_blob(self, blob):
+        object_path = self.get_object_path(blob.hexsha, blob.mode)
+        if os.path.exists(object_path):
+            return object_path
+
+        write_atomic(
+            object_path,
+            lambda fhd: shutil.copyfileobj(blob.data_stream, fhd),
+            'wb',
+            0o555 if blob.mode & stat.S_IXUSR else 0o444
+        )
+        return object_path
+
+    def export_tree(self, commit):
+        """Used to export a commit's files as hard links into the object store."""
+
+        tree_dir = self.get_tree_dir(commit.hexsha)
+        if os.path.exists(tree_dir):
+            return tree_dir
+
+        trees_dir = os.path.dirname(tree_dir)
+        os.makedirs(trees_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=trees_dir, prefix='.tmp-')
+        _log.debug('[git] exporting %s to %s', commit.hexsha, tree_dir)
+        for item in commit.tree.traverse():
+            path = os.path.join(tmp_dir, item.path)
+            if item.type != 'blob':
+                os.makedirs(path, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if item.mode == SYMLINK_MODE:
+                os.symlink(item.data_stream.read().decode(), path)
+                continue
+            object_path = self.store_blob(item)
+            try:
+                os.link(object_path, path)
+            except OSError:
+                shutil.copyfile(object_path, path)
+        try:
+            os.rename(tmp_dir, tree_dir)
+        except OSError:
+            # another process exported the same commit first
+            shutil.rmtree(tmp_dir)
+        return tree_dir
+
+    def fetch(self, package: str):
+        """Used to return the local directory and browse url of a package."""
+
+        from git import Repo
+
+        package_name, package_version = parse_package(package)
+        mirror_dir = self.get_mirror_dir(package_name)
+        _log.debug('using package mirror: %s', mirror_dir)
+
+        with get_lock(mirror_dir):
+            metadata = self.read_metadata(mirror_dir)
+            if os.path.exists(mirror_dir):
+                repo = Repo(mirror_dir)
+                commit = self.resolve_commit(repo, package_version)
+                if self.offline:
+                    _log.debug('[git] using cached %s package (offline)', package)
+                elif package_version is not None and commit is not None:
+                    _log.debug('[git] using pinned %s package', package)
+                elif commit is None or (mirror_dir not in _fetched_mirrors and (self.refresh or self.is_stale(metadata))):
+                    _log.debug('[git] updating %s package', package)
+                    repo.git.fetch('origin', '--prune', '--tags')
+                    metadata['fetched_at'] = time.time()
+                    _fetched_mirrors.add(mirror_dir)
+                    commit = self.resolve_commit(repo, package_version)
+                else:
+                    _log.debug('[git] using cached %s package', package)
+            else:
+                if self.offline:
+                    raise RuntimeError(f'package {package} is not cached and offline mode is enabled')
+                _log.debug('[git] pulling %s package', package_name)
+                repo = Repo.clone_from(
+                    f'https://{package_name}',
+                    mirror_dir,
+                    mirror=True
+                )
+                metadata['fetched_at'] = time.time()
+                _fetched_mirrors.add(mirror_dir)
+                commit = self.resolve_commit(repo, package_version)
+
+            if commit is None:
+                raise RuntimeError(f'version {package_version} not found for package {package_name}')
+
+            metadata.setdefault('commits', {})[package] = commit.hexsha
+            self.write_metadata(mirror_dir, metadata)
+
+        pkg_dir = self.export_tree(commit)
+        _log.debug('using package dir: %s', pkg_dir)
+
+        branch = package_version or repo.head.reference.name
+        package_base_url = urljoin(repo.remotes.origin.url + '/', f'blob/{branch}/')
+        return pkg_dir, package_base_url
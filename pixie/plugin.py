@@ -1,6 +1,7 @@
 from typing import Dict
 from .runtime import PixieRuntime
 from .steps import PixieStep
+from .plugins import find_plugins, init_plugin
 
 
 class PixiePlugin:
@@ -9,7 +10,21 @@ class PixiePlugin:
 
 
 class PixiePluginContext(dict):
-    steps: Dict[str, PixieStep] = {}
-    
+    steps: Dict[str, PixieStep]
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.steps = {}
+
     def add_step(self, step_name: str, step: PixieStep):
         self.steps[step_name] = step
+
+    def get_step(self, step_name: str):
+        """Used to get a step, loading the plugin that provides it on first use."""
+
+        step = self.steps.get(step_name)
+        if step is None:
+            for plugin_name in find_plugins(step_name):
+                init_plugin(plugin_name, self)
+            step = self.steps.get(step_name)
+        return step
@@ -1,18 +1,80 @@
 from pkgutil import iter_modules
 from pathlib import Path
 from importlib import import_module
+from functools import lru_cache
+import threading
+
+
+# action name -> plugin module, so a plugin is only imported once one of
+# its actions is used
+PLUGIN_MANIFEST = {
+    'aws': 'aws',
+    'config_write': 'config',
+    'config_read': 'config',
+    'set_context': 'core',
+    'add_note': 'core',
+    'add_todo': 'core',
+    'module': 'core',
+    'file': 'core',
+    'prompt': 'core',
+    'fetch': 'fetch',
+    'github': 'github',
+    'log': 'log',
+    'debug': 'log',
+    'print': 'log',
+    'dump': 'log',
+    'pixie': 'pixie',
+    'shell': 'shell',
+}
+
+_plugins = {}
+_steps = {}
+_lock = threading.RLock()
 
 
 def load_plugins():
     """Load all plugins in the plugins directory"""
-    path = get_path_to_plugins()
-    path = Path(path)
-    modules = []
-    for _, name, _ in iter_modules([str(path)]):
-        if not name.startswith('__'):
+    return [load_plugin(name) for name in get_plugin_names()]
+
+
+def load_plugin(name):
+    """Load a plugin module, importing it once per process"""
+    with _lock:
+        module = _plugins.get(name)
+        if module is None:
             module = import_module(f'.{name}', package=__name__)
-            modules.append(module)
-    return modules
+            _plugins[name] = module
+        return module
+
+
+def init_plugin(name, context):
+    """Load a plugin and register its steps with a context"""
+    with _lock:
+        steps = _steps.get(name)
+        if steps is None:
+            # init runs once per process, but every context has its own
+            # steps, so keep the steps it registers for the next contexts
+            plugin_context = type(context)(context)
+            load_plugin(name).init(plugin_context)
+            steps = _steps[name] = dict(plugin_context.steps)
+    for step_name, step in steps.items():
+        context.add_step(step_name, step)
+
+
+def find_plugins(step_name):
+    """Get the plugins that may provide a step"""
+    if step_name in PLUGIN_MANIFEST:
+        return [PLUGIN_MANIFEST[step_name]]
+    known = set(PLUGIN_MANIFEST.values())
+    return [name for name in get_plugin_names() if name not in known]
+
+
+@lru_cache(maxsize=None)
+def get_plugin_names():
+    """Get the names of the modules in the plugins directory"""
+    path = get_path_to_plugins()
+    return tuple(name for _, name, _ in iter_modules([str(path)]) if not name.startswith('__'))
+
 
 def get_path_to_plugins():
     """Get the path to the plugins directory"""
@@ -1,9 +1,8 @@
-import boto3
-
 from ruamel.yaml import YAML
 
 from pixie.rendering import render_options
 
+from ..aws import get_client
 from ..steps import PixieStep
 from ..plugin import PixiePluginContext
 
@@ -19,7 +18,6 @@ class AwsStep(PixieStep):
         credentials = options.get('credentials', {})
         client_name = fn_parts[0]
         fn_name = fn_parts[1]
-        session = boto3.Session(**credentials)
 
-        aws_client = session.client(client_name)
+        aws_client = get_client(client_name, credentials)
         return getattr(aws_client, fn_name), False
@@ -1,10 +1,13 @@
 from collections import abc
+import hashlib
 import importlib
 import importlib
-from importlib import util
+from importlib import metadata, util
+import logging
 import subprocess
 import sys
 import os
+import threading
 
 from ..utils import merge
 from pixie.context import PixieContext
@@ -13,6 +16,16 @@ from ..steps import PixieStep
 from ..plugin import PixiePluginContext
 from ..rendering import render_options, render_text, render_value
 
+from packaging.requirements import InvalidRequirement, Requirement
+
+
+_log = logging.getLogger(__name__)
+
+_modules = {}
+_modules_lock = threading.Lock()
+
+_dependencies_lock = threading.Lock()
+_satisfied = set()
 
 def init(context: PixiePluginContext):
     context.add_step("set_context", SetStep())
@@ -63,13 +76,12 @@ class ModuleStep(PixieStep):
     def run(self, context: PixieContext, step: dict, runtime: PixieRuntime):
         options = render_options(step, context)
 
-        install_dependencies(options.get('dependencies', []))
+        dependencies = options.get('dependencies', [])
+        if dependencies:
+            install_dependencies(dependencies, get_dependencies_dir(context['__package']['path']))
 
         file = context.resolve_package_path(options['path'])
-        spec = util.spec_from_file_location("module.name", file)
-        foo = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(foo)
-        main_fn = getattr(foo, 'main')
+        main_fn = getattr(load_module(file), 'main')
 
         module_context = PixieContext(
             **render_options(options.get('context', {}), context),
@@ -98,6 +110,87 @@ class FileStep(PixieStep):
             return fhd.read()
 
 
-def install_dependencies(dependencies):
-    for dep in dependencies:
-        subprocess.check_call([sys.executable, '-m', 'pip', 'install', dep])
+def get_dependencies_dir(package_dir):
+    digest = hashlib.sha1(os.path.realpath(package_dir).encode()).hexdigest()
+    python = 'py%s.%s' % sys.version_info[:2]
+    return os.path.realpath(os.path.expanduser(os.path.join('~/.pixie/cache/modules', python, digest)))
+
+
+def is_installed(dependency):
+    """Used to check whether an installed distribution satisfies a requirement."""
+
+    try:
+        requirement = Requirement(dependency)
+    except InvalidRequirement:
+        return False
+    if requirement.marker is not None and not requirement.marker.evaluate():
+        # not needed on this platform
+        return True
+    if requirement.url:
+        return False
+
+    try:
+        version = metadata.version(requirement.name)
+    except metadata.PackageNotFoundError:
+        return False
+    return requirement.specifier.contains(version, prereleases=True)
+
+
+def install_dependencies(dependencies, target=None):
+    """Used to pip install the dependencies that are not installed yet.
+
+    Missing dependencies are installed with a single pip call. With a
+    target, they go to that directory, which is added to the end of
+    sys.path. pip puts the whole dependency tree in the target, so those
+    copies must not shadow the packages pixie itself runs with.
+    """
+
+    key = (target, tuple(dependencies))
+    with _dependencies_lock:
+        if key in _satisfied:
+            return []
+
+        if target is not None and target not in sys.path:
+            sys.path.append(target)
+            importlib.invalidate_caches()
+
+        missing = [dependency for dependency in dependencies if not is_installed(dependency)]
+        if missing:
+            _log.debug('installing %s', ', '.join(missing))
+            cmd = [sys.executable, '-m', 'pip', 'install']
+            if target is not None:
+                os.makedirs(target, exist_ok=True)
+                cmd += ['--upgrade', '--target', target]
+            subprocess.check_call(cmd + missing)
+            importlib.invalidate_caches()
+        _satisfied.add(key)
+        return missing
+
+
+def load_module(path):
+    """Used to load a module file, reusing it until the file changes.
+
+    Each file gets its own module name, registered in sys.modules.
+    """
+
+    real_path = os.path.realpath(path)
+    stat = os.stat(real_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    with _modules_lock:
+        entry = _modules.get(real_path)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        name = 'pixie_module_' + hashlib.sha1(real_path.encode()).hexdigest()[:16]
+        _log.debug('loading module %s as %s', real_path, name)
+        spec = util.spec_from_file_location(name, real_path)
+        module = util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            sys.modules.pop(name, None)
+            raise
+        _modules[real_path] = (version, module)
+        return module
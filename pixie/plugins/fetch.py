@@ -1,15 +1,22 @@
+import hashlib
+import json
 import logging
 import os
-import pathlib
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
 
 from ..context import PixieContext
 
-from ..rendering import render, render_options, render_token_file, render_tokens
+from ..rendering import render, render_options, render_package_file, stream_token_file
 from ..steps import PixieStep
 from ..runtime import PixieRuntime
 from ..plugin import PixiePluginContext
+from ..utils import write_atomic
 
-from fnmatch import fnmatch
+from fnmatch import fnmatch, translate
 
 
 _log = logging.getLogger(__name__)
@@ -19,20 +26,202 @@ def init(context: PixiePluginContext):
     context.add_step('fetch', FetchStep())
 
 
-def is_match(path, patterns):
-    for pattern in patterns:
-        if fnmatch(path, pattern):
-            return True
-    return False
+# a path below a directory that only a trailing wildcard can match
+PRUNE_PROBE = '\x00\x00/\x00\x00'
 
+MANIFEST_NAME = '.pixie-fetch.json'
 
-def render_file(path, context):
-    """Used to render a Jinja template."""
+CHUNK_SIZE = 1024 * 1024
 
+
+class GlobMatcher:
+    """Matches a path against a list of fnmatch patterns with one compiled regex."""
+
+    def __init__(self, patterns) -> None:
+        self.patterns = list(patterns or [])
+        self.regex = None
+        if self.patterns:
+            self.regex = re.compile('|'.join(
+                f'(?P<p{idx}>{translate(pattern)})' for idx, pattern in enumerate(self.patterns)
+            ))
+
+    def match(self, path):
+        """Used to return the index of the first matching pattern, or None."""
+
+        if self.regex is None:
+            return None
+        m = self.regex.match(path)
+        if m is None:
+            return None
+        return int(m.lastgroup[1:])
+
+    def matches(self, path):
+        return self.match(path) is not None
+
+    def matches_all_under(self, dir_path):
+        """Used to check whether every path below a directory would match."""
+
+        return self.matches(dir_path + '/' + PRUNE_PROBE)
+
+
+def render_file(path, context, package_dir=None):
+    """Used to render a Jinja template.
+
+    With a package_dir, path is relative to it and the package's shared
+    environment is used.
+    """
+
+    if package_dir is not None:
+        return render_package_file(path, context, package_dir)
     template_dir, template_name = os.path.split(path)
     return render(template_name, context, template_dir)
 
 
+def is_filtered(path, filter):
+    """Used to match a path the way Path.rglob(filter) would."""
+
+    while filter.startswith('**/'):
+        filter = filter[3:]
+    if filter in ('', '**', '*'):
+        return True
+    if '**' in filter:
+        return fnmatch(path, '*' + filter)
+    return PurePosixPath(path).match(filter)
+
+
+def iter_files(root, filter, exclude: GlobMatcher = None):
+    """Used to enumerate the files under root once, as paths relative to it.
+
+    Directories whose whole contents are excluded are not walked. Like
+    Path.rglob, symlinked directories are not followed.
+    """
+
+    for dir_path, dir_names, file_names in os.walk(root):
+        rel_dir = dir_path[len(root)+1:]
+        if exclude is not None:
+            dir_names[:] = [
+                name for name in dir_names
+                if not exclude.matches_all_under(os.path.join(rel_dir, name))
+            ]
+        dir_names.sort()
+        for name in sorted(file_names):
+            path = os.path.join(rel_dir, name)
+            if is_filtered(path, filter) and os.path.isfile(os.path.join(dir_path, name)):
+                yield path
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fhd:
+        for chunk in iter(lambda: fhd.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FetchManifest:
+    """Remembers the size, mtime and hash of the files a fetch wrote to a target.
+
+    A target file whose size and mtime still match its entry is not read
+    again to learn its hash. Without a path nothing is remembered.
+    """
+
+    def __init__(self, path=None) -> None:
+        self.path = path
+        self.entries = {}
+        if path:
+            try:
+                with open(path, 'r') as fhd:
+                    self.entries = json.load(fhd)
+            except (OSError, ValueError):
+                pass
+
+    def target_digest(self, name, target, stat):
+        entry = self.entries.get(name)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns and entry['sha256']:
+            return entry['sha256']
+        return file_digest(target)
+
+    def record(self, name, target, digest):
+        stat = os.stat(target)
+        self.entries[name] = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=digest)
+
+    def save(self):
+        if not self.path:
+            return
+        write_atomic(self.path, lambda fhd: json.dump(self.entries, fhd, indent=2, sort_keys=True))
+
+
+def write_token_file(source, target, tokens):
+    with open(target, 'w', encoding='utf-8', newline='') as fhd:
+        stream_token_file(source, fhd, tokens)
+
+
+def fetch_token_file(name, source, target, tokens, manifest: FetchManifest, stat=None):
+    """Used to stream a token file to its target without holding it in memory.
+
+    An existing target is only replaced when the output differs from it.
+    """
+
+    if stat is None:
+        write_token_file(source, target, tokens)
+        manifest.record(name, target, file_digest(target))
+        return 'created'
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.tmp-')
+    os.close(fd)
+    try:
+        write_token_file(source, tmp_path, tokens)
+        digest = file_digest(tmp_path)
+        if os.stat(tmp_path).st_size == stat.st_size and manifest.target_digest(name, target, stat) == digest:
+            manifest.record(name, target, digest)
+            return 'unchanged'
+        os.chmod(tmp_path, stat.st_mode & 0o7777)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    manifest.record(name, target, digest)
+    return 'updated'
+
+
+def fetch_file(context, name, source, target, template, manifest: FetchManifest, incremental=True, package_dir=None):
+    """Used to render or copy one file, returning created, updated or unchanged."""
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        stat = os.stat(target) if incremental else None
+    except FileNotFoundError:
+        stat = None
+
+    if template and 'tokens' in template:
+        _log.debug(f'rendering token file {source} to {target}')
+        return fetch_token_file(name, source, target, template['tokens'], manifest, stat)
+    elif template:
+        _log.debug(f'rendering template {source} to {target}')
+        content = render_file(name, context, package_dir) if package_dir else render_file(source, context)
+        data = content.encode()
+        digest = hashlib.sha256(data).hexdigest()
+        if stat is not None and stat.st_size == len(data) and manifest.target_digest(name, target, stat) == digest:
+            manifest.record(name, target, digest)
+            return 'unchanged'
+        with open(target, 'wb') as fhd:
+            fhd.write(data)
+    else:
+        digest = None
+        if stat is not None and stat.st_size == os.stat(source).st_size:
+            digest = file_digest(source)
+            if manifest.target_digest(name, target, stat) == digest:
+                manifest.record(name, target, digest)
+                return 'unchanged'
+        _log.debug(f'copying {source} to {target}')
+        # copied by the OS (sendfile where available), never read into memory
+        shutil.copyfile(source, target)
+
+    manifest.record(name, target, digest)
+    return 'created' if stat is None else 'updated'
+
+
 class FetchStep(PixieStep):
     def run(self, context: PixieContext, step: dict, runtime: PixieRuntime):
         opts = render_options(step, context)
@@ -43,46 +232,48 @@ class FetchStep(PixieStep):
         target = opts.get('target', '.')
         full_target = context.resolve_target_path(target)
         filter = opts.get('filter', '**/*')
+        parallel = int(opts.get('parallel', 1))
+        incremental = opts.get('incremental', True)
+        manifest_name = opts.get('manifest', MANIFEST_NAME)
 
         _log.debug(f'fetching {full_pkg_dir} to {full_target} using {filter}')
 
         templates = opts.get('templates', [])
-        exclude = opts.get('exclude', []) + ['.git', '.git/*', '.pixie.yaml']
+        exclude = GlobMatcher(opts.get('exclude', []) + ['.git', '.git/*', '.pixie.yaml', MANIFEST_NAME, manifest_name or MANIFEST_NAME])
         include = opts.get('include', None)
+        include = GlobMatcher(include) if include is not None else None
+        template_matcher = GlobMatcher(template['path'] for template in templates)
 
-        paths = pathlib.Path(full_pkg_dir).rglob(filter)
-
-        for p_obj in paths:
-            p = str(p_obj)
-            tfile = p[len(full_pkg_dir)+1:]
-            t = os.path.join(full_target, tfile)
-            tbase, _ = os.path.split(t)
-            if include is not None and not is_match(tfile, include):
+        tasks = []
+        for tfile in iter_files(full_pkg_dir, filter, exclude):
+            if include is not None and not include.matches(tfile):
                 continue
-            if is_match(tfile, exclude):
+            if exclude.matches(tfile):
                 continue
-            if not os.path.exists(tbase):
-                os.makedirs(tbase)
-
-            if p_obj.is_file():
-                template = get_template(tfile, templates)
-                if template:
-                    _log.debug(f'rendering template {p} to {t}')
-                    if 'tokens' in template:
-                        content = render_token_file(p, template['tokens'])
-                    else:
-                        content = render_file(p, context)
-                    with open(t, 'w') as fhd:
-                        fhd.write(content)
-                else:
-                    _log.debug(f'copying {p} to {t}')
-                    with open(p, 'rb') as fhd:
-                        source_content = fhd.read()
-                        with open(t, 'wb') as fhd2:
-                            fhd2.write(source_content)
-
-def get_template(path, templates):
-    for template in templates:
-        if fnmatch(path, template['path']):
-            return template
-    return None
+            template_idx = template_matcher.match(tfile)
+            tasks.append((
+                tfile,
+                os.path.join(full_pkg_dir, tfile),
+                os.path.join(full_target, tfile),
+                templates[template_idx] if template_idx is not None else None
+            ))
+
+        manifest_path = os.path.join(full_target, manifest_name) if incremental and manifest_name else None
+        manifest = FetchManifest(manifest_path)
+        counts = dict(created=0, updated=0, unchanged=0)
+        try:
+            if parallel > 1:
+                with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='pixie-fetch') as pool:
+                    futures = [pool.submit(fetch_file, context, *task, manifest, incremental, full_pkg_dir) for task in tasks]
+                    for future in futures:
+                        counts[future.result()] += 1
+            else:
+                for task in tasks:
+                    counts[fetch_file(context, *task, manifest, incremental, full_pkg_dir)] += 1
+        finally:
+            if counts['created'] or counts['updated'] or counts['unchanged']:
+                manifest.save()
+
+        _log.info('fetched %s files (%s created, %s updated, %s unchanged)',
+            len(tasks), counts['created'], counts['updated'], counts['unchanged'])
+        return counts
@@ -1,11 +1,19 @@
-from github import Github
+import logging
+import threading
 
-import os
 from pixie.rendering import render_options
-from ruamel.yaml import YAML
+
+from ..github import DEFAULT_POOL_SIZE, get_client, get_host_token
 
 from ..steps import PixieStep
 from ..plugin import PixiePluginContext
+from ..utils import raise_errors, run_parallel
+
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_BULK_WORKERS = 8
+DEFAULT_PER_HOST = 4
 
 
 def init(context: PixiePluginContext):
@@ -17,14 +25,10 @@ def fetch_token(options, context):
         return options['token']
 
     host = options.get('host', 'github.com')
-    gh_hosts = os.path.expanduser('~/.config/gh/hosts.yml')
-    if os.path.exists(gh_hosts):
-        yaml = YAML()
-        with open(gh_hosts, 'r') as f:
-            gh_hosts = yaml.load(f)
-        if host in gh_hosts:
-            return gh_hosts[host]['oauth_token']
-    
+    token = get_host_token(host)
+    if token:
+        return token
+
     return context.environ.get('GITHUB_TOKEN')
 
 
@@ -34,11 +38,52 @@ def get_base_url(host):
     return f'https://{host}/api/v3'
 
 
+def call_operation(obj, operation):
+    fn = getattr(obj, operation['fn'])
+    return fn(*operation.get('args', []), **operation.get('kwargs', {}))
+
+
 class GithubStep(PixieStep):
     def resolve_fn(self, obj_name, fn_name, context, step):
         options = render_options(step.get('with', {}), context)
         host = options.get('host', 'github.com')
         base_url = get_base_url(host)
         token = fetch_token(options, context)
-        g = Github(token, base_url=base_url)
+        g = get_client(base_url, token, int(options.get('pool_size', DEFAULT_POOL_SIZE)))
         return getattr(g, fn_name), False
+
+    def bulk(self, context, step, runtime):
+        """Used to run a list of client calls on a bounded thread pool.
+
+        Each operation calls fn on the client of its host, then each
+        call in its then list on the previous result. At most per_host
+        operations run against a host at once. Results are returned in
+        operation order.
+        """
+
+        options = render_options(step, context)
+        operations = options.pop('operations', [])
+        parallel = int(options.pop('parallel', DEFAULT_BULK_WORKERS))
+        per_host = int(options.pop('per_host', DEFAULT_PER_HOST))
+        fail_fast = options.pop('fail_fast', True)
+        pool_size = int(options.pop('pool_size', max(per_host, DEFAULT_POOL_SIZE)))
+
+        hosts = {operation.get('host', options.get('host', 'github.com')) for operation in operations}
+        semaphores = {host: threading.BoundedSemaphore(per_host) for host in hosts}
+
+        def run_operation(index):
+            operation = operations[index]
+            operation_options = dict(options)
+            operation_options.update((name, operation[name]) for name in ('host', 'token') if name in operation)
+            host = operation_options.get('host', 'github.com')
+            client = get_client(get_base_url(host), fetch_token(operation_options, context), pool_size)
+            with semaphores[host]:
+                result = call_operation(client, operation)
+                for then in operation.get('then', []):
+                    result = call_operation(result, then)
+            return result
+
+        _log.debug('running %s github operations on %s threads', len(operations), parallel)
+        results, errors = run_parallel(run_operation, len(operations), parallel, fail_fast, 'pixie-github')
+        raise_errors(errors, len(operations), 'github operations failed')
+        return results
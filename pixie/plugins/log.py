@@ -1,4 +1,5 @@
-from charset_normalizer import logging
+import logging
+
 from pixie.context import PixieContext
 from ..runtime import PixieRuntime
 from ..steps import PixieStep
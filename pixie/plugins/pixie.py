@@ -1,4 +1,3 @@
-from re import T
 from pixie.context import PixieContext
 from pixie.runtime import PixieRuntime
 from pixie.steps import PixieStep
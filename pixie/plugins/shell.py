@@ -1,12 +1,18 @@
 from asyncio import subprocess
+import json
+import logging
 import subprocess
 import os
 
 from ..context import PixieContext
-from ..steps import PixieStep
+from ..steps import PixieStep, is_buffering_output
 from ..runtime import PixieRuntime
 from ..plugin import PixiePluginContext
 from ..rendering import render_options, render_text
+from ..shell import DEFAULT_MAX_LINES, OutputCapture, ShellSession, run_command
+
+
+_log = logging.getLogger(__name__)
 
 color = {
     'PURPLE': '\033[35m',
@@ -30,13 +36,34 @@ class ShellStep(PixieStep):
     def run(self, context: PixieContext, step: dict, runtime: PixieRuntime):
         options = render_options(step, context)
         term_colors = dict_to_str(color, 'TERM_%s="%s"\n')
-        cmd = """
+        capture = options.get('capture', False) or options.get('json', False)
+        output = None
+        if capture:
+            output = OutputCapture(int(options.get('max_lines', DEFAULT_MAX_LINES)), options.get('echo', True))
+
+        session = context.get('__shell')
+        if isinstance(session, ShellSession):
+            session.run(options['command'], cwd=options.get('workdir'), setup=term_colors, output=output)
+        else:
+            cmd = """
 set +x -ae
 %s
 %s
 """ % (term_colors, options['command'])
-        cwd = options.get('workdir', context.get('__target', '.'))
-        subprocess.run(cmd, cwd=cwd, check=True, shell=True)
+            cwd = options.get('workdir', context.get('__target', '.'))
+            if output is None and not is_buffering_output():
+                subprocess.run(cmd, cwd=cwd, check=True, shell=True)
+            else:
+                run_command(cmd, cwd=cwd, output=output)
+
+        if output is None:
+            return None
+        if output.dropped:
+            _log.debug('kept the last %s lines of shell output, %s dropped', len(output.lines), output.dropped)
+        text = output.getvalue().rstrip('\n')
+        if options.get('json', False):
+            return json.loads(text)
+        return text
 
 
 def dict_to_str(d, fmt='%s=%s\n'):
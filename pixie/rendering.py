@@ -1,21 +1,20 @@
+from functools import lru_cache
 import hashlib
 from io import StringIO
 import json
 import os
 from pathlib import Path
+import posixpath
 import re
-from tabnanny import check
-import requests
 import tempfile
+import threading
+import time
 import logging
-import boto3
 from typing import List
-from git import Repo
-from giturlparse import parse
 
 from jinja2 import Environment, ChainableUndefined
-from jinja2 import FileSystemLoader
-from jinja2.nativetypes import NativeEnvironment
+from jinja2 import FileSystemBytecodeCache, FileSystemLoader
+from jinja2.nativetypes import NativeEnvironment, native_concat
 from ruamel.yaml import YAML
 from termcolor import colored
 
@@ -24,24 +23,123 @@ from pixie.context import PixieContext
 
 _log = logging.getLogger(name=__name__)
 
+VARIABLE_START_STRING = '${{'
+VARIABLE_END_STRING = '}}'
+
+TEMPLATE_MARKERS = (VARIABLE_START_STRING, '{%', '{#')
+
+ENVIRONMENT_CACHE_SIZE = 64
+TEMPLATE_CACHE_SIZE = 2048
+LITERAL_CACHE_SIZE = 8192
+TOKEN_CHUNK_SIZE = 64 * 1024
+
+PARAMETER_TTL = 300
+PARAMETER_BATCH_SIZE = 10
+
+PARAMETER_REF_REGEX = re.compile(r'''aws\.get_parameter\(\s*(['"])([^'"]+)\1\s*\)''')
+
 
 class AwsUtils(object):
+    """Used to read SSM parameters from templates.
+
+    Values are memoized per profile for ttl seconds, so a parameter used
+    in a loop is only read once. prefetch_parameters and
+    prefetch_parameters_by_path fill the memo with batched calls.
+    """
+
+    def __init__(self, ttl=PARAMETER_TTL) -> None:
+        self.ttl = ttl
+        self.parameters = {}
+        self.lock = threading.Lock()
+
+    def get_cached(self, name, profile_name):
+        with self.lock:
+            entry = self.parameters.get((profile_name, name))
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry
+
+    def set_cached(self, name, profile_name, value):
+        with self.lock:
+            self.parameters[(profile_name, name)] = (value, time.monotonic() + self.ttl)
+
+    def clear_cache(self):
+        with self.lock:
+            self.parameters.clear()
+
     def get_parameter(self, name, profile_name=None):
-        try:
-            session = boto3.Session(
-                profile_name=profile_name
-            )
+        entry = self.get_cached(name, profile_name)
+        if entry is not None:
+            return entry[0]
+
+        from .aws import get_client
 
-            ssm_client = session.client('ssm')
+        try:
+            ssm_client = get_client('ssm', dict(profile_name=profile_name))
             param = ssm_client.get_parameter(Name=name)
-            return param['Parameter']['Value']
+            value = param['Parameter']['Value']
+            self.set_cached(name, profile_name, value)
+            return value
         except Exception as ex:
             _log.debug(ex)
+            if type(ex).__name__ == 'ParameterNotFound':
+                self.set_cached(name, profile_name, '')
         return ''
 
+    def prefetch_parameters(self, names, profile_name=None):
+        """Used to read parameters in batches of ten with get_parameters.
+
+        Parameters that are already memoized are skipped and missing ones
+        are memoized as empty strings.
+        """
+
+        from .aws import get_client
+
+        names = [name for name in dict.fromkeys(names) if self.get_cached(name, profile_name) is None]
+        if not names:
+            return
+        _log.debug('prefetching %s ssm parameters', len(names))
+        ssm_client = get_client('ssm', dict(profile_name=profile_name))
+        for idx in range(0, len(names), PARAMETER_BATCH_SIZE):
+            result = ssm_client.get_parameters(Names=names[idx:idx + PARAMETER_BATCH_SIZE])
+            for param in result.get('Parameters', []):
+                self.set_cached(param['Name'], profile_name, param['Value'])
+            for name in result.get('InvalidParameters', []):
+                self.set_cached(name, profile_name, '')
+
+    def prefetch_parameters_by_path(self, path, profile_name=None, recursive=True):
+        """Used to read every parameter below a path with get_parameters_by_path."""
+
+        from .aws import get_client
+
+        ssm_client = get_client('ssm', dict(profile_name=profile_name))
+        paginator = ssm_client.get_paginator('get_parameters_by_path')
+        for page in paginator.paginate(Path=path, Recursive=recursive):
+            for param in page.get('Parameters', []):
+                self.set_cached(param['Name'], profile_name, param['Value'])
+
+
+def find_parameter_names(value, names=None):
+    """Used to collect the literal names passed to aws.get_parameter in templates."""
+
+    names = [] if names is None else names
+    if isinstance(value, str):
+        if 'get_parameter' in value:
+            names.extend(m.group(2) for m in PARAMETER_REF_REGEX.finditer(value))
+    elif isinstance(value, dict):
+        for item in value.values():
+            find_parameter_names(item, names)
+    elif isinstance(value, list):
+        for item in value:
+            find_parameter_names(item, names)
+    return names
+
 
 class GitUtils(object):
     def remote_info(self, path, remote_name):
+        from git import Repo
+        from giturlparse import parse
+
         try:
             repo = Repo(path)
             remote = repo.remote(remote_name)
@@ -51,6 +149,9 @@ class GitUtils(object):
         return {}
     
     def owner_repo(self, path, remote_name):
+        from git import Repo
+        from giturlparse import parse
+
         try:
             repo = Repo(path)
             remote = repo.remote(remote_name)
@@ -107,6 +208,8 @@ class RenderUtils(object):  # pylint: disable=R0903
             return hashlib.md5(fhd.read()).hexdigest()
 
     def download_file(cls, url, checksum):
+        import requests
+
         file = tempfile.mktemp()
         resp = requests.get(url)
         if resp.status_code == 200:
@@ -177,21 +280,145 @@ def get_parser(path):
         exit('Parser format not supported: %s' % ext)
 
 
+_shared_utils = dict(
+    aws=AwsUtils(),
+    git=GitUtils(),
+    path=os.path,
+    tempfile=tempfile
+)
+
+
+def get_aws_utils() -> AwsUtils:
+    return _shared_utils['aws']
+
+
 def get_utils(context):
     return dict(
         utils=RenderUtils(context),
-        aws=AwsUtils(),
-        git=GitUtils(),
-        path=os.path,
-        tempfile=tempfile
+        **_shared_utils
+    )
+
+
+_bytecode_cache = None
+
+
+def get_bytecode_cache_dir():
+    return os.path.realpath(os.path.expanduser('~/.pixie/cache/templates'))
+
+
+def set_bytecode_cache(cache_dir):
+    """Used to keep compiled package templates in cache_dir (None disables it).
+
+    Environments that are already pooled keep the cache they were built with,
+    so they are dropped.
+    """
+
+    global _bytecode_cache
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        _bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    else:
+        _bytecode_cache = None
+    get_environment.cache_clear()
+
+
+_render_root = threading.local()
+
+
+class PackageEnvironment(Environment):
+    """Loads the templates of one package, resolving includes like a per-directory loader.
+
+    Include, import and extends names, nested ones included, are looked up
+    relative to the directory of the file being rendered. Templates keep
+    working as they did when each rendered file's directory had its own
+    loader.
+    """
+
+    def join_path(self, template, parent):
+        root = getattr(_render_root, 'dir', '')
+        return posixpath.normpath(posixpath.join(root, template))
+
+
+@lru_cache(maxsize=ENVIRONMENT_CACHE_SIZE)
+def get_environment(kind='text', template_dir=None,
+                    variable_start_string=VARIABLE_START_STRING,
+                    variable_end_string=VARIABLE_END_STRING):
+    """Used to get a shared Jinja environment.
+
+    Environments are pooled per kind (native, text, file or package),
+    template directory and delimiter config, so filters are only
+    registered once and loaded templates are reused.
+    """
+
+    options = dict(
+        variable_start_string=variable_start_string,
+        variable_end_string=variable_end_string,
+        undefined=ChainableUndefined
+    )
+    if kind == 'native':
+        env = NativeEnvironment(**options)
+    elif kind == 'file':
+        env = Environment(loader=FileSystemLoader(template_dir), keep_trailing_newline=True, **options)
+    elif kind == 'package':
+        env = PackageEnvironment(
+            loader=FileSystemLoader(template_dir),
+            keep_trailing_newline=True,
+            bytecode_cache=_bytecode_cache,
+            cache_size=TEMPLATE_CACHE_SIZE,
+            **options
+        )
+    else:
+        env = Environment(keep_trailing_newline=True, **options)
+    add_filters(env)
+    return env
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(text, kind='text'):
+    """Used to compile a template string, keyed by its source text."""
+
+    return get_environment(kind).from_string(text)
+
+
+@lru_cache(maxsize=LITERAL_CACHE_SIZE)
+def is_template(text):
+    """Used to check whether a string needs to go through Jinja.
+
+    Strings without template markers render to themselves, so callers can
+    skip the environment entirely. Carriage returns are treated as markers
+    since Jinja normalizes newlines.
+    """
+
+    if '\r' in text:
+        return True
+    for marker in TEMPLATE_MARKERS:
+        if marker in text:
+            return True
+    return False
+
+
+def template_cache_info():
+    """Used to return the hit/miss counters of the rendering caches."""
+
+    return dict(
+        environments=get_environment.cache_info(),
+        templates=compile_template.cache_info(),
+        literals=is_template.cache_info()
     )
 
 
+def clear_template_cache():
+    """Used to drop all pooled environments and compiled templates."""
+
+    is_template.cache_clear()
+    compile_template.cache_clear()
+    get_environment.cache_clear()
+
+
 def render(template_name, context, template_dir):
     """Used to render a Jinja template."""
 
-    env = Environment(loader=FileSystemLoader(template_dir), variable_start_string='${{', variable_end_string='}}', keep_trailing_newline=True, undefined=ChainableUndefined)
-    add_filters(env)
+    env = get_environment('file', template_dir)
     utils = get_utils(context)
 
     template = env.get_template(template_name)
@@ -199,6 +426,26 @@ def render(template_name, context, template_dir):
     return template.render(context=context, **utils, **context)
 
 
+def render_package_file(template_name, context, package_dir):
+    """Used to render a template of a package with the package's shared environment.
+
+    template_name is relative to package_dir.
+    """
+
+    env = get_environment('package', os.path.realpath(package_dir))
+    utils = get_utils(context)
+    template_name = template_name.replace(os.sep, '/')
+
+    template = env.get_template(template_name)
+
+    previous = getattr(_render_root, 'dir', '')
+    _render_root.dir = posixpath.dirname(template_name)
+    try:
+        return template.render(context=context, **utils, **context)
+    finally:
+        _render_root.dir = previous
+
+
 def add_filters(env):
     env.filters['formatlist'] = format_list
     env.filters['yaml'] = yaml_format
@@ -218,12 +465,13 @@ def render_value(text, context: PixieContext):
     if '\n' in text:
         return render_text(text, context)
 
-    env = NativeEnvironment(variable_start_string='${{', variable_end_string='}}', undefined=ChainableUndefined)
-    add_filters(env)
+    if not is_template(text):
+        # same result as a native template made of a single data node
+        return native_concat([text] if text else [])
 
     utils = get_utils(context)
 
-    template = env.from_string(text)
+    template = compile_template(text, 'native')
 
     return template.render(context=context, **utils, **context)
 
@@ -234,15 +482,60 @@ def render_text(text, context: PixieContext):
     if text is None:
         return None
 
-    env = Environment(variable_start_string='${{', variable_end_string='}}', keep_trailing_newline=True, undefined=ChainableUndefined)
-    add_filters(env)
+    if isinstance(text, str) and not is_template(text):
+        return text
+
     utils = get_utils(context)
 
-    template = env.from_string(text)
+    template = compile_template(text, 'text')
 
     return template.render(context=context, **utils, **context)
 
 
+def compile_value(text):
+    """Used to compile a value once, returning a function that renders it."""
+
+    if not isinstance(text, str):
+        return lambda context: text
+
+    if '\n' in text:
+        return compile_text(text)
+
+    if not is_template(text):
+        return lambda context: native_concat([text] if text else [])
+
+    template = compile_template(text, 'native')
+    return lambda context: template.render(context=context, **get_utils(context), **context)
+
+
+def compile_text(text):
+    """Used to compile a text template once, returning a function that renders it."""
+
+    if text is None:
+        return lambda context: None
+
+    if isinstance(text, str) and not is_template(text):
+        return lambda context: text
+
+    template = compile_template(text, 'text')
+    return lambda context: template.render(context=context, **get_utils(context), **context)
+
+
+def compile_options(options):
+    """Used to compile an option tree once, returning a function that renders it."""
+
+    if isinstance(options, str):
+        return compile_value(options)
+    elif isinstance(options, list):
+        items = [compile_options(x) for x in options]
+        return lambda context: [item(context) for item in items]
+    elif isinstance(options, dict):
+        items = [(k, compile_options(v)) for k, v in options.items()]
+        return lambda context: {k: item(context) for k, item in items}
+    else:
+        return lambda context: options
+
+
 def _render_value(value, context: PixieContext, exclude_keys: List[str]):
     if isinstance(value, str):
         return render_value(value, context)
@@ -265,17 +558,76 @@ def _render_value(value, context: PixieContext, exclude_keys: List[str]):
 def render_options(options: dict, context: PixieContext, exclude_keys=[]):
     return _render_value(options, context, exclude_keys)
 
-def render_token_file(path: str, tokens: dict):
-    """Used to render a Token File."""
+class TokenReplacer:
+    """Used to replace a set of tokens in a single pass.
+
+    All tokens are matched by one alternation regex, longest first, so a
+    token that contains another token wins. Replacements are not scanned
+    again for tokens.
+    """
+
+    def __init__(self, tokens: dict) -> None:
+        self.tokens = {str(token): str(value) for token, value in tokens.items() if token}
+        self.max_length = max((len(token) for token in self.tokens), default=0)
+        self.regex = None
+        if self.tokens:
+            self.regex = re.compile('|'.join(
+                re.escape(token) for token in sorted(self.tokens, key=len, reverse=True)
+            ))
+
+    def replace(self, content: str):
+        if self.regex is None:
+            return content
+        return self.regex.sub(lambda m: self.tokens[m.group(0)], content)
+
+    def stream(self, source, target, chunk_size=TOKEN_CHUNK_SIZE):
+        """Used to copy a text stream, replacing tokens without reading it all.
+
+        Only matches that start early enough for the longest token to fit in
+        the buffer are replaced; the rest of the buffer is carried over to the
+        next chunk, so tokens spanning chunk boundaries are still found.
+        """
+
+        buffer = ''
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                target.write(self.replace(buffer))
+                return
+            buffer += chunk
+            if self.regex is None:
+                target.write(buffer)
+                buffer = ''
+                continue
+
+            limit = len(buffer) - self.max_length
+            pos = 0
+            for m in self.regex.finditer(buffer):
+                if m.start() > limit:
+                    break
+                target.write(buffer[pos:m.start()])
+                target.write(self.tokens[m.group(0)])
+                pos = m.end()
+            end = max(pos, limit + 1)
+            target.write(buffer[pos:end])
+            buffer = buffer[end:]
+
+
+def stream_token_file(path: str, target, tokens: dict):
+    """Used to write a Token File to an open target stream."""
 
     with open(path, 'r') as file_handle:
-        content = file_handle.read()
+        TokenReplacer(tokens).stream(file_handle, target)
+
+
+def render_token_file(path: str, tokens: dict):
+    """Used to render a Token File."""
 
-    return render_tokens(content, tokens)
+    content = StringIO()
+    stream_token_file(path, content, tokens)
+    return content.getvalue()
 
 def render_tokens(content: str, tokens: dict):
     """Used to render a Token File."""
 
-    for token in tokens:
-        content = content.replace(token, tokens[token])
-    return content
+    return TokenReplacer(tokens).replace(content)
@@ -1,9 +1,7 @@
 from getpass import getpass
 import re
-from giturlparse import parse
 from urllib.parse import urlparse
 
-import inquirer
 import sys
 
 from pixie.context import PixieContext
@@ -36,6 +34,8 @@ def str2url(value: str):
 
 
 def str2giturl(value: str):
+    from giturlparse import parse
+
     return parse(str(value), check_domain=False)
 
 
@@ -59,8 +59,12 @@ def convert(v, type):
 
 class PixieRuntime:
     config: PixieConfig
-    def __init__(self, config: PixieConfig) -> None:
+    offline: bool
+    refresh: bool
+    def __init__(self, config: PixieConfig, offline=False, refresh=False) -> None:
         self.config = config
+        self.offline = offline
+        self.refresh = refresh
         
     def write(self, message: str, format=False):
         pass
@@ -80,6 +84,8 @@ class PixieConsoleRuntime(PixieRuntime):
         self.write(message + '\n')
 
     def ask(self, prompt):
+        import inquirer
+
         name = prompt.get('name')
         default = prompt.get('default')
         validate = prompt.get('validate')
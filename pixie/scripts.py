@@ -0,0 +1,84 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from ruamel.yaml import YAML
+
+from .utils import write_atomic
+
+
+_log = logging.getLogger(__name__)
+
+SCRIPT_CACHE_SIZE = 128
+SCRIPT_CACHE_VERSION = 1
+
+_scripts = OrderedDict()
+_scripts_lock = threading.Lock()
+
+
+def get_cache_dir():
+    return os.path.realpath(os.path.expanduser('~/.pixie/cache/scripts'))
+
+
+def parse_script(path):
+    """Used to parse a pixie script with the (C based, when available) safe loader."""
+
+    yaml = YAML(typ='safe')
+    with open(path, 'r') as fhd:
+        return yaml.load(fhd)
+
+
+def read_cached(cache_file):
+    try:
+        with open(cache_file, 'rb') as fhd:
+            return fhd.read()
+    except OSError:
+        return None
+
+
+def write_cached(cache_file, data):
+    try:
+        write_atomic(cache_file, lambda fhd: fhd.write(data), 'wb')
+    except OSError as ex:
+        _log.debug('failed to write script cache %s: %s', cache_file, ex)
+
+
+def load_script(path, cache_dir=None):
+    """Used to load a pixie script, reusing earlier parses of the same file.
+
+    Parses are cached in process, and in cache_dir when given, keyed by
+    the file's real path, mtime and size. Every call returns a fresh copy,
+    so callers are free to modify the result.
+    """
+
+    real_path = os.path.realpath(path)
+    stat = os.stat(real_path)
+    key = (SCRIPT_CACHE_VERSION, real_path, stat.st_mtime_ns, stat.st_size)
+
+    with _scripts_lock:
+        data = _scripts.get(key)
+        if data is not None:
+            _scripts.move_to_end(key)
+
+    if data is None:
+        cache_file = None
+        if cache_dir:
+            digest = hashlib.sha1(repr(key).encode()).hexdigest()
+            cache_file = os.path.join(cache_dir, digest + '.pickle')
+            data = read_cached(cache_file)
+
+        if data is None:
+            _log.debug('parsing pixie script %s', real_path)
+            data = pickle.dumps(parse_script(real_path), pickle.HIGHEST_PROTOCOL)
+            if cache_file:
+                write_cached(cache_file, data)
+
+        with _scripts_lock:
+            _scripts[key] = data
+            while len(_scripts) > SCRIPT_CACHE_SIZE:
+                _scripts.popitem(last=False)
+
+    return pickle.loads(data)
@@ -0,0 +1,162 @@
+import logging
+import os
+from collections import deque
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+
+
+_log = logging.getLogger(__name__)
+
+SHELL = '/bin/sh'
+
+DEFAULT_MAX_LINES = 1000
+
+
+class OutputCapture:
+    """Tees command output to the console while keeping only its last lines."""
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, echo=True) -> None:
+        self.lines = deque(maxlen=max_lines)
+        self.echo = echo
+        self.dropped = 0
+
+    def write(self, text):
+        if self.echo:
+            sys.stdout.write(text)
+        if len(self.lines) == self.lines.maxlen:
+            self.dropped += 1
+        self.lines.append(text)
+
+    def flush(self):
+        if self.echo:
+            sys.stdout.flush()
+
+    def getvalue(self):
+        return ''.join(self.lines)
+
+
+def run_command(command, cwd=None, output=None):
+    """Used to run a command in a new shell, streaming its stdout line by line."""
+
+    output = output or sys.stdout
+    process = subprocess.Popen(
+        command,
+        cwd=cwd,
+        shell=True,
+        stdout=subprocess.PIPE,
+        text=True,
+        errors='replace',
+        bufsize=1
+    )
+    with process:
+        for line in process.stdout:
+            output.write(line)
+    output.flush()
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, getattr(output, 'getvalue', str)())
+
+
+class ShellSession:
+    """Keeps one shell process running for the shell steps of a job.
+
+    Each command is written to a temp file and sourced by the shell, so
+    variables, functions and the working directory carry over to the next
+    command. The shell prints a sentinel line with the exit code after each
+    command. The shell runs with -e, like a one-off shell step. A failing
+    command therefore ends the shell, and the next command starts a new
+    one.
+    """
+
+    def __init__(self, cwd=None, shell=SHELL) -> None:
+        self.cwd = cwd
+        self.shell = shell
+        self.sentinel = f'__pixie_{uuid.uuid4().hex}__'
+        self.process = None
+        self.lock = threading.Lock()
+
+    def start(self, setup=''):
+        _log.debug('starting persistent shell in %s', self.cwd)
+        self.process = subprocess.Popen(
+            [self.shell],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=self.cwd,
+            text=True,
+            errors='replace',
+            bufsize=1
+        )
+        self.process.stdin.write('set +x -ae\n%s\n' % setup)
+        self.process.stdin.flush()
+
+    def run(self, command, cwd=None, setup='', output=None):
+        """Used to run a command in the shell, writing its output to output.
+
+        Output goes to the console unless an output such as OutputCapture
+        is given. setup is only run when the shell has to be started.
+        Raises CalledProcessError when the command fails.
+        """
+
+        output = output or sys.stdout
+
+        with self.lock:
+            if self.process is None:
+                self.start(setup)
+
+            fd, script = tempfile.mkstemp(prefix='pixie-', suffix='.sh')
+            try:
+                with os.fdopen(fd, 'w') as fhd:
+                    if cwd is not None:
+                        fhd.write('cd %s\n' % shlex.quote(cwd))
+                    fhd.write(command)
+                    fhd.write('\n')
+
+                try:
+                    self.process.stdin.write(
+                        ". %s </dev/null\nprintf '%%s %%d\\n' %s $?\n" % (shlex.quote(script), self.sentinel)
+                    )
+                    self.process.stdin.flush()
+                except BrokenPipeError:
+                    # read_output reports how the shell exited
+                    pass
+                returncode = self.read_output(output)
+            finally:
+                os.remove(script)
+
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command, getattr(output, 'getvalue', str)())
+
+    def read_output(self, output):
+        for line in self.process.stdout:
+            idx = line.find(self.sentinel)
+            if idx < 0:
+                output.write(line)
+                continue
+            if idx:
+                output.write(line[:idx])
+            output.flush()
+            return int(line[idx + len(self.sentinel):])
+
+        # the shell exited before the command finished
+        output.flush()
+        returncode = self.process.wait()
+        _log.debug('persistent shell exited with %s', returncode)
+        self.process = None
+        return returncode
+
+    def close(self):
+        with self.lock:
+            if self.process is None:
+                return
+            process, self.process = self.process, None
+        try:
+            process.stdin.close()
+            process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        process.stdout.close()
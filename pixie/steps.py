@@ -1,13 +1,127 @@
 from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from graphlib import TopologicalSorter
 import logging
+import sys
+import threading
+from typing import Any, Callable, NamedTuple, Optional, Tuple
 
-from pixie.rendering import render_options, render_text, render_value
+from pixie.rendering import compile_options, compile_text, compile_value
+from pixie.utils import raise_errors, run_parallel
 from .context import PixieContext
 from .runtime import PixieRuntime
 
 
 _log = logging.getLogger(__name__)
 
+_log_buffer = threading.local()
+
+
+class BufferedLogFilter(logging.Filter):
+    """Holds back records logged by threads that are buffering their output."""
+
+    def filter(self, record):
+        records = getattr(_log_buffer, 'records', None)
+        if records is None:
+            return True
+        if not records or records[-1] is not record:
+            records.append(record)
+        return False
+
+
+_buffered_log_filter = BufferedLogFilter()
+
+
+def install_log_buffering():
+    for handler in logging.root.handlers:
+        if _buffered_log_filter not in handler.filters:
+            handler.addFilter(_buffered_log_filter)
+
+
+class BufferedStdout:
+    """Holds back stdout writes of threads that are buffering their output."""
+
+    def __init__(self, stream) -> None:
+        self.stream = stream
+
+    def write(self, text):
+        records = getattr(_log_buffer, 'records', None)
+        if records is None:
+            return self.stream.write(text)
+        records.append(text)
+        return len(text)
+
+    def flush(self):
+        if getattr(_log_buffer, 'records', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+_stdout_lock = threading.Lock()
+_stdout_proxy = None
+_stdout_users = 0
+
+
+def install_stdout_buffering():
+    """Used to route sys.stdout through BufferedStdout while foreach steps run in parallel.
+
+    Calls are counted, so parallel steps that overlap share one proxy and
+    release_stdout_buffering removes it when the last one is done.
+    """
+
+    global _stdout_proxy, _stdout_users
+    with _stdout_lock:
+        if _stdout_users == 0:
+            _stdout_proxy = sys.stdout = BufferedStdout(sys.stdout)
+        _stdout_users += 1
+
+
+def release_stdout_buffering():
+    global _stdout_proxy, _stdout_users
+    with _stdout_lock:
+        _stdout_users -= 1
+        if _stdout_users == 0:
+            # leave stdout alone if someone replaced it in the meantime
+            if sys.stdout is _stdout_proxy:
+                sys.stdout = _stdout_proxy.stream
+            _stdout_proxy = None
+
+
+def is_buffering_output():
+    return getattr(_log_buffer, 'records', None) is not None
+
+
+def flush_log_records(records):
+    """Used to replay buffered log records and stdout writes in order."""
+
+    for record in records:
+        if isinstance(record, str):
+            sys.stdout.write(record)
+        else:
+            logging.getLogger(record.name).handle(record)
+    if records:
+        sys.stdout.flush()
+
+def compile_lazily(compile_fn, value):
+    """Used to defer compiling a template until a step first renders it.
+
+    Template errors then surface when the step runs, under its on_error
+    handling, and never for steps that are skipped.
+    """
+
+    compiled = None
+
+    def render(context):
+        nonlocal compiled
+        if compiled is None:
+            compiled = compile_fn(value)
+        return compiled(context)
+
+    return render
+
+
 class PixieStep:
     def resolve_fn(self, obj_name: str, fn_name: str, context: PixieContext):
         pass
@@ -15,6 +129,32 @@ class PixieStep:
         pass
 
 
+class PixieStepNode(NamedTuple):
+    """A normalized step, compiled once and walked on every execution."""
+
+    step: dict
+    kind: str
+    step_id: Optional[str]
+    action: Optional[str]
+    needs: Tuple[str, ...]
+    on_error: Optional[str]
+    condition: Optional[Callable[[PixieContext], Any]]
+    description: Optional[Callable[[PixieContext], Any]]
+    output_to_context: Optional[Callable[[PixieContext], Any]]
+    options: Optional[Callable[[PixieContext], Any]]
+    executor: Optional[Callable]
+    is_plugin: bool
+    items: Optional[Callable[[PixieContext], Any]]
+    item_name: Optional[str]
+    parallel: Optional[Callable[[PixieContext], Any]]
+    fail_fast: bool
+    children: Tuple['PixieStepNode', ...]
+
+
+class PixieStepPlan(tuple):
+    """An immutable sequence of compiled step nodes."""
+
+
 class PixieStepExecution():
     def __init__(self, plugin_context) -> None:
         self.plugin_context = plugin_context
@@ -24,9 +164,9 @@ class PixieStepExecution():
         obj_name = name_parts[0]
         fn_name = ':'.join(name_parts[1:]) if len(name_parts) > 1 else 'run'
 
-        if obj_name in self.plugin_context.steps:
+        step_plugin = self.plugin_context.get_step(obj_name)
+        if step_plugin is not None:
             _log.debug('locating %s in plugin', step_name)
-            step_plugin = self.plugin_context.steps[obj_name]
             if hasattr(step_plugin, fn_name):
                 return getattr(step_plugin, fn_name), True
             else:
@@ -88,48 +228,126 @@ class PixieStepExecution():
             }, **step)
         return step
 
-    def _execute(self, step, context: PixieContext, runtime, steps_context):
-        if 'if' in step:
-            enabled = render_value(step['if'], context)
-            if enabled == False:
-                return
+    def compile(self, steps) -> PixieStepPlan:
+        """Used to compile job steps into a plan that can be executed repeatedly."""
+
+        return PixieStepPlan(self.compile_step(step) for step in (steps or []))
+
+    def compile_step(self, step) -> PixieStepNode:
+        step = self.normalize_step(step)
+
+        condition = compile_lazily(compile_value, step['if']) if 'if' in step else None
+        needs = step.get('needs', [])
+        if isinstance(needs, str):
+            needs = [needs]
+        node = dict(
+            step=step,
+            step_id=step.get('id'),
+            action=None,
+            needs=tuple(needs),
+            on_error=step.get('on_error'),
+            condition=condition,
+            description=None,
+            output_to_context=None,
+            options=None,
+            executor=None,
+            is_plugin=False,
+            items=None,
+            item_name=None,
+            parallel=None,
+            fail_fast=True,
+            children=PixieStepPlan()
+        )
+
         if 'group' in step:
-            group_steps = step['group']
-            self.execute(context, runtime, steps_context, group_steps)
+            node.update(kind='group', children=self.compile(step['group']))
         elif 'foreach' in step:
             foreach_steps = step['foreach']
-            items = render_value(foreach_steps.get('items', []), context)
-            context_name = foreach_steps.get('item_name', None)
-            step_id = step.get('id', 'foreach')
+            node.update(
+                kind='foreach',
+                step_id=step.get('id', 'foreach'),
+                items=compile_lazily(compile_value, foreach_steps.get('items', [])),
+                item_name=foreach_steps.get('item_name', None),
+                parallel=compile_lazily(compile_value, foreach_steps['parallel']) if 'parallel' in foreach_steps else None,
+                fail_fast=foreach_steps.get('fail_fast', True),
+                children=self.compile(foreach_steps.get('steps', []))
+            )
+        else:
+            action_name = step.get('action', None)
+            executor, is_plugin = self.get_static_executor(action_name)
+            node.update(
+                kind='action',
+                step_id=step.get('id', action_name),
+                action=action_name,
+                description=compile_lazily(compile_text, step.get('description', None)),
+                output_to_context=compile_lazily(compile_text, step['output_to_context']) if 'output_to_context' in step else None,
+                # plugin executors render the raw with: block themselves
+                options=None if is_plugin else compile_lazily(self.compile_step_options, step.get('with', {})),
+                executor=executor,
+                is_plugin=is_plugin
+            )
+        return PixieStepNode(**node)
+
+    def compile_step_options(self, step_options):
+        if isinstance(step_options, Mapping):
+            return compile_options(step_options)
+        return compile_value(step_options)
+
+    def get_static_executor(self, step_name: str):
+        """Used to resolve plugin executors that do not depend on the context."""
+
+        if not step_name:
+            return None, False
+        name_parts = step_name.split(':')
+        obj_name = name_parts[0]
+        fn_name = ':'.join(name_parts[1:]) if len(name_parts) > 1 else 'run'
+
+        step_plugin = self.plugin_context.get_step(obj_name)
+        if step_plugin is not None and hasattr(step_plugin, fn_name):
+            return getattr(step_plugin, fn_name), True
+        return None, False
+
+    def _execute(self, node: PixieStepNode, context: PixieContext, runtime, steps_context):
+        if node.condition is not None:
+            enabled = node.condition(context)
+            if enabled == False:
+                return
+        if node.kind == 'group':
+            self.execute(context, runtime, steps_context, node.children)
+        elif node.kind == 'foreach':
+            items = node.items(context)
+            context_name = node.item_name
+            step_id = node.step_id
+            parallel = int(node.parallel(context) or 1) if node.parallel else 1
+            if parallel > 1:
+                self._execute_parallel(node, list(items), parallel, context, runtime)
+                return
             for item in items:
                 context.set_step(step_id, item)
                 if context_name is not None:
                     context[context_name] = item
-                self.execute(context, runtime, steps_context, foreach_steps.get('steps', []))
+                self.execute(context, runtime, steps_context, node.children)
         else:
-            executor = None
-            executor_step_name = None
-            is_plugin = False
-            action_name = step.get('action', None)
-            executor, is_plugin = self.get_executor(step, action_name, context)
+            step = node.step
+            action_name = node.action
+            executor, is_plugin = node.executor, node.is_plugin
+            if executor is None:
+                executor, is_plugin = self.get_executor(step, action_name, context)
             _log.debug(step)
             if executor:
-                step_options = step.get('with', {})
-
-                step_id = step.get('id', action_name)
-                description = render_text(step.get('description', None), context)
+                step_id = node.step_id
+                description = node.description(context)
                 if description:
                     _log.info(f'[{step_id}] {description}')
-                
+
                 _log.debug(f'[{step_id}] running')
                 if is_plugin:
-                    if isinstance(executor_step_name, Mapping):
-                        step_options['__id'] = step_id
+                    step_options = step.get('with', {})
                     _log.debug('%s: %s', step_id, step_options);
                     result = executor(context, step_options, runtime)
                 else:
+                    step_options = node.options(context)
                     if isinstance(step_options, Mapping):
-                        step_options = render_options(step_options, context)
                         args = step_options.get('args', [step_options])
                         kwargs = step_options.get('kwargs', {})
                         if 'args' in step_options and 'kwargs' not in step_options:
@@ -139,24 +357,119 @@ class PixieStepExecution():
                         else:
                             result = executor(*args, **kwargs)
                     else:
-                        result = executor(render_value(step_options, context))
-                if 'output_to_context' in step:
-                    output_to_context = render_text(step.get('output_to_context', None), context)
+                        result = executor(step_options)
+                if node.output_to_context is not None:
+                    output_to_context = node.output_to_context(context)
                     context[output_to_context] = result
                 context.set_step(step_id, result)
 
-    def execute(self, context: PixieContext, runtime, steps_context, steps):
-        step: dict
-        for step in steps:
-            step = self.normalize_step(step)
-            on_error = step.get('on_error')
+    def _execute_parallel(self, node: PixieStepNode, items: list, parallel: int, context: PixieContext, runtime):
+        """Used to run foreach iterations on a bounded thread pool.
+
+        Each iteration gets a child context. Log records and stdout are
+        buffered per iteration and replayed in item order, and the steps of
+        each iteration are collected into an ordered list under the foreach
+        id.
+        """
+
+        step_id = node.step_id
+        context_name = node.item_name
+        children = [context.child() for _ in items]
+        logs = [[] for _ in items]
+
+        def run_item(index):
+            child = children[index]
+            child.set_step(step_id, items[index])
+            if context_name is not None:
+                child[context_name] = items[index]
+            _log_buffer.records = logs[index]
             try:
-                self._execute(step, context, runtime, steps_context)
-            except Exception as ex:
-                if on_error == 'warn':
-                    _log.warn(ex)
-                elif on_error == 'ignore':
-                    _log.debug(ex)
-                else:
-                    raise
+                self.execute(child, runtime, child['steps'], node.children)
+                return dict(child['steps'].maps[0])
+            finally:
+                _log_buffer.records = None
+
+        def item_done(index):
+            flush_log_records(logs[index])
+            context.todos.extend(children[index].todos)
+            context.notes.extend(children[index].notes)
+
+        install_log_buffering()
+        install_stdout_buffering()
+        try:
+            results, errors = run_parallel(
+                run_item, len(items), parallel, node.fail_fast, f'pixie-{step_id}', item_done
+            )
+        finally:
+            release_stdout_buffering()
+
+        context.set_step(step_id, results)
+        raise_errors(errors, len(items), f'iterations failed in {step_id}')
+
+    def _execute_node(self, node: PixieStepNode, context: PixieContext, runtime, steps_context):
+        try:
+            self._execute(node, context, runtime, steps_context)
+        except Exception as ex:
+            if node.on_error == 'warn':
+                _log.warn(ex)
+            elif node.on_error == 'ignore':
+                _log.debug(ex)
+            else:
+                raise
+
+    def execute(self, context: PixieContext, runtime, steps_context, steps):
+        if not isinstance(steps, PixieStepPlan):
+            steps = self.compile(steps)
+
+        node: PixieStepNode
+        for node in steps:
+            self._execute_node(node, context, runtime, steps_context)
+
+    def execute_graph(self, context: PixieContext, runtime, steps_context, steps, parallel=None):
+        """Used to run steps as a dependency graph built from their needs.
+
+        Steps whose needs are satisfied run concurrently on a pool of
+        parallel threads and share the context, so later templates still
+        see results in steps. After a failure no new steps are started.
+        """
+
+        if not isinstance(steps, PixieStepPlan):
+            steps = self.compile(steps)
+
+        step_indexes = {}
+        for index, node in enumerate(steps):
+            if 'id' in node.step:
+                step_indexes.setdefault(node.step['id'], []).append(index)
+
+        graph = {}
+        for index, node in enumerate(steps):
+            dependencies = set()
+            for need in node.needs:
+                if need not in step_indexes:
+                    raise ValueError(f'step {node.step_id} needs unknown step {need}')
+                dependencies.update(step_indexes[need])
+            graph[index] = dependencies
+
+        sorter = TopologicalSorter(graph)
+        sorter.prepare()
 
+        error = None
+        with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='pixie-step') as pool:
+            running = {}
+            while sorter.is_active():
+                if error is None:
+                    for index in sorter.get_ready():
+                        future = pool.submit(self._execute_node, steps[index], context, runtime, steps_context)
+                        running[future] = index
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    ex = future.exception()
+                    if ex is None:
+                        sorter.done(index)
+                    elif error is None:
+                        error = ex
+        if error is not None:
+            raise error
@@ -1,7 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
 from ruamel.yaml import YAML
 
 import json
 import os
+import tempfile
+import threading
 
 
 def read_config(path, default_value):
@@ -38,6 +41,30 @@ def save_yaml(data, path):
         return yaml.dump(data, fhd)
 
 
+def write_atomic(path, write, mode='w', file_mode=None):
+    """Used to write a file through a temp file next to it, so readers never see a partial file.
+
+    write is called with the open temp file. The directory is created when
+    missing, and the temp file is removed when writing fails.
+    """
+
+    dir_path = os.path.dirname(path)
+    os.makedirs(dir_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, mode) as fhd:
+            write(fhd)
+        if file_mode is not None:
+            os.chmod(tmp_path, file_mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
 def merge(source, destination):
     for key, value in source.items():
         if isinstance(value, dict):
@@ -48,3 +75,51 @@ def merge(source, destination):
             destination[key] = value
 
     return destination
+
+
+def run_parallel(fn, count, parallel, fail_fast=True, thread_name_prefix='', on_done=None):
+    """Used to call fn(index) for each of count indexes on a pool of parallel threads.
+
+    Returns the results and the errors by index. A failed call's result is
+    {'error': message}. With fail_fast, calls that have not started when
+    one fails are skipped and their result stays None. on_done(index) is
+    called in index order as the calls finish.
+    """
+
+    results = [None] * count
+    errors = {}
+    stop = threading.Event()
+
+    def call(index):
+        if stop.is_set():
+            return
+        try:
+            results[index] = fn(index)
+        except Exception as ex:
+            errors[index] = ex
+            results[index] = {'error': str(ex)}
+            if fail_fast:
+                stop.set()
+
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix=thread_name_prefix) as pool:
+        futures = [pool.submit(call, index) for index in range(count)]
+        for index, future in enumerate(futures):
+            future.result()
+            if on_done is not None:
+                on_done(index)
+    return results, errors
+
+
+def raise_errors(errors, count, description):
+    """Used to raise the errors of run_parallel.
+
+    A single error is raised as is, several as a RuntimeError chained to
+    the first one.
+    """
+
+    if not errors:
+        return
+    first = min(errors)
+    if len(errors) == 1:
+        raise errors[first]
+    raise RuntimeError(f'{len(errors)} of {count} {description}') from errors[first]
@@ -0,0 +1,99 @@
+from pixie import aws, engine, rendering
+from pixie.context import PixieContext
+
+
+def test_get_client_is_cached():
+    aws.clear_clients()
+    try:
+        client = aws.get_client('ssm', {'region_name': 'us-east-1'})
+        assert aws.get_client('ssm', {'region_name': 'us-east-1', 'profile_name': None}) is client
+        assert aws.get_client('ssm', {'region_name': 'us-west-2'}) is not client
+        assert aws.get_client('s3', {'region_name': 'us-east-1'}) is not client
+
+        aws.set_max_clients(1)
+        assert len(aws._clients) == 1
+        assert aws.get_client('ssm', {'region_name': 'us-east-1'}) is not client
+    finally:
+        aws.set_max_clients(aws.DEFAULT_MAX_CLIENTS)
+        aws.clear_clients()
+
+
+class FakeSsm:
+    def __init__(self, parameters):
+        self.parameters = parameters
+        self.calls = []
+
+    def get_parameter(self, Name):
+        self.calls.append(('get_parameter', Name))
+        return {'Parameter': {'Name': Name, 'Value': self.parameters[Name]}}
+
+    def get_parameters(self, Names):
+        self.calls.append(('get_parameters', tuple(Names)))
+        return {
+            'Parameters': [{'Name': name, 'Value': self.parameters[name]} for name in Names if name in self.parameters],
+            'InvalidParameters': [name for name in Names if name not in self.parameters]
+        }
+
+    def get_paginator(self, name):
+        ssm = self
+
+        class Paginator:
+            def paginate(self, Path, Recursive):
+                ssm.calls.append((name, Path))
+                yield {'Parameters': [
+                    {'Name': key, 'Value': value} for key, value in ssm.parameters.items() if key.startswith(Path + '/')
+                ]}
+
+        return Paginator()
+
+
+def test_prefetch_parameters_in_batches(monkeypatch):
+    ssm = FakeSsm({f'/app/p{idx}': f'v{idx}' for idx in range(12)})
+    monkeypatch.setattr(aws, 'get_client', lambda service_name, credentials=None: ssm)
+
+    utils = rendering.AwsUtils()
+    utils.prefetch_parameters([f'/app/p{idx}' for idx in range(12)] + ['/missing', '/app/p0'])
+    assert [call[0] for call in ssm.calls] == ['get_parameters', 'get_parameters']
+    assert len(ssm.calls[0][1]) == 10
+
+    assert utils.get_parameter('/app/p11') == 'v11'
+    assert utils.get_parameter('/missing') == ''
+    assert len(ssm.calls) == 2
+
+    utils.clear_cache()
+    utils.prefetch_parameters_by_path('/app')
+    assert utils.get_parameter('/app/p3') == 'v3'
+    assert ssm.calls[-1] == ('get_parameters_by_path', '/app')
+
+
+def test_find_parameter_names():
+    assert rendering.find_parameter_names({
+        'context': {'token': "${{ aws.get_parameter('/a') }}"},
+        'steps': [{'print': '${{ aws.get_parameter("/b") }} ${{ aws.get_parameter(name) }}'}]
+    }) == ['/a', '/b']
+
+
+def test_prefetch_ssm_parameters_renders_with_job_context(monkeypatch):
+    ssm = FakeSsm({'/app/db': 'db', '/app/unused': 'x'})
+    profiles = []
+
+    def get_client(service_name, credentials=None):
+        profiles.append(credentials['profile_name'])
+        return ssm
+
+    monkeypatch.setattr(aws, 'get_client', get_client)
+    utils = rendering.get_aws_utils()
+    utils.clear_cache()
+    try:
+        engine.prefetch_parameter_names({'context': {'a': "${{ aws.get_parameter('/app/db') }}"}}, {
+            'steps': [{'print': "${{ aws.get_parameter('/app/unused') }}"}]
+        })
+        engine.prefetch_ssm_parameters({
+            'ssm': {'parameters': ['/app/db'], 'profile_name': '${{ profile }}'}
+        }, PixieContext(profile='prod'))
+
+        assert ssm.calls == [('get_parameters', ('/app/db',)), ('get_parameters', ('/app/db',))]
+        assert profiles == [None, 'prod']
+        assert utils.get_cached('/app/db', 'prod')[0] == 'db'
+    finally:
+        utils.clear_cache()
@@ -0,0 +1,38 @@
+import os
+
+from pixie import completion
+
+
+LIBRARY = {
+    'org/templates': {
+        'python/lib': {},
+        'python/app': {},
+        'node/app': {},
+    },
+    '.': {
+        'local/hello': {},
+    }
+}
+
+
+def test_complete():
+    index = completion.build_index(LIBRARY)
+
+    assert index['packages'] == ['.', 'org/templates']
+    assert completion.complete(index['aliases'], 'python/') == ['python/app', 'python/lib']
+    assert completion.complete(index['aliases'], '') == index['aliases']
+    assert completion.complete(index['aliases'], 'ruby') == []
+
+
+def test_load_index_detects_stale_config(tmp_path):
+    index_file = str(tmp_path / 'completion.json')
+    config_file = str(tmp_path / 'config.yaml')
+
+    with open(config_file, 'w') as fhd:
+        fhd.write('library: {}\n')
+    completion.save_index(LIBRARY, index_file)
+    assert completion.load_index(index_file, config_file)['packages'] == ['.', 'org/templates']
+
+    index_mtime = os.stat(index_file).st_mtime_ns
+    os.utime(config_file, ns=(index_mtime + 10**9, index_mtime + 10**9))
+    assert completion.load_index(index_file, config_file) is None
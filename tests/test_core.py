@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+from pixie.plugins import core
+
+
+def test_is_installed():
+    assert core.is_installed('pytest')
+    assert core.is_installed('pytest>=1.0')
+    assert not core.is_installed('pytest>=999')
+    assert not core.is_installed('pixie-missing-package')
+    assert core.is_installed('pixie-missing-package; python_version < "3"')
+
+
+def test_install_dependencies_once(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(subprocess, 'check_call', lambda cmd: calls.append(cmd))
+    target = str(tmp_path / 'deps')
+    try:
+        assert core.install_dependencies(['pytest', 'pixie-missing-a', 'pixie-missing-b'], target) == ['pixie-missing-a', 'pixie-missing-b']
+        assert core.install_dependencies(['pytest', 'pixie-missing-a', 'pixie-missing-b'], target) == []
+        assert sys.path[-1] == target
+    finally:
+        sys.path.remove(target)
+
+    assert calls == [[
+        sys.executable, '-m', 'pip', 'install', '--upgrade', '--target', target, 'pixie-missing-a', 'pixie-missing-b'
+    ]]
+
+
+def test_load_module_is_cached(tmp_path):
+    path = tmp_path / 'module.py'
+    path.write_text('import sys\nloaded = []\ndef main():\n    return 1\n')
+
+    module = core.load_module(str(path))
+    assert core.load_module(str(path)) is module
+    assert sys.modules[module.__name__] is module
+
+    path.write_text('def main():\n    return 2\n')
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    reloaded = core.load_module(str(path))
+    assert reloaded is not module
+    assert reloaded.main() == 2
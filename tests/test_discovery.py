@@ -0,0 +1,45 @@
+import os
+from unittest.mock import patch
+
+from pixie import discovery
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fhd:
+        fhd.write(content)
+
+
+def make_package(root):
+    write_file(os.path.join(root, '.pixie.yaml'), 'name: root\njobs:\n  hello:\n    description: Say hello\n')
+    write_file(os.path.join(root, 'sub', '.pixie.yaml'), 'name: sub\njobs:\n  build: {}\n')
+    write_file(os.path.join(root, '.git', '.pixie.yaml'), 'name: git\n')
+    write_file(os.path.join(root, 'node_modules', 'x', '.pixie.yaml'), 'name: node\n')
+    write_file(os.path.join(root, 'build', '.pixie.yaml'), 'name: build\n')
+    write_file(os.path.join(root, 'sub', 'out', '.pixie.yaml'), 'name: out\n')
+    write_file(os.path.join(root, '.gitignore'), '# build output\nbuild/\n')
+    write_file(os.path.join(root, 'sub', '.gitignore'), 'out\n')
+
+
+def test_find_scripts_prunes_directories(tmp_path):
+    make_package(str(tmp_path))
+
+    assert discovery.find_scripts(str(tmp_path)) == ['.pixie.yaml', 'sub/.pixie.yaml']
+
+
+def test_scan_package_only_parses_changed_scripts(tmp_path):
+    pkg_dir = str(tmp_path / 'pkg')
+    manifest_file = str(tmp_path / 'manifest.json')
+    make_package(pkg_dir)
+
+    entries = discovery.scan_package(pkg_dir, manifest_file, max_workers=2)
+    assert entries['.pixie.yaml']['jobs'] == {'hello': 'Say hello'}
+    assert entries['sub/.pixie.yaml']['name'] == 'sub'
+
+    write_file(os.path.join(pkg_dir, 'sub', '.pixie.yaml'), 'name: changed\njobs: {}\n')
+    with patch('pixie.discovery.load_script', wraps=discovery.load_script) as load_script:
+        entries = discovery.scan_package(pkg_dir, manifest_file)
+
+    assert load_script.call_count == 1
+    assert entries['sub/.pixie.yaml']['name'] == 'changed'
+    assert entries['.pixie.yaml']['name'] == 'root'
@@ -0,0 +1,53 @@
+import os
+
+from pixie import engine
+from pixie.runtime import PixieRuntime
+
+
+def write_script(path, content):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, '.pixie.yaml'), 'w') as fhd:
+        fhd.write(content)
+
+
+def test_collect_packages():
+    assert engine.collect_packages([
+        {'pixie': {'package': 'org/a@v1'}},
+        {'group': [
+            {'pixie': {'package': '${{ package }}'}},
+            {'foreach': {'steps': [
+                {'action': 'pixie', 'with': {'package': 'sub', 'job': 'build'}}
+            ]}}
+        ]}
+    ]) == [
+        {'package': 'org/a@v1', 'script': '.pixie.yaml', 'job': 'default'},
+        {'package': 'sub', 'script': '.pixie.yaml', 'job': 'build'},
+    ]
+
+
+def test_prefetch_nested_packages(tmp_path):
+    write_script(str(tmp_path), '''
+jobs:
+  default:
+    steps:
+      - pixie:
+          package: sub
+          job: build
+''')
+    write_script(str(tmp_path / 'sub'), '''
+jobs:
+  build:
+    steps:
+      - pixie:
+          package: ../leaf
+''')
+    write_script(str(tmp_path / 'leaf'), '''
+jobs:
+  default:
+    steps:
+      - print: leaf
+''')
+
+    fetched = engine.prefetch(PixieRuntime({'cache': {'scripts': False}}), {'package': str(tmp_path)})
+
+    assert fetched == [str(tmp_path), 'sub', '../leaf']
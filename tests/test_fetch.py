@@ -0,0 +1,120 @@
+import os
+
+from pixie.context import PixieContext
+from pixie.plugins.fetch import FetchStep, GlobMatcher, iter_files
+from pixie.runtime import PixieRuntime
+
+
+def write_file(path, content, mode='w'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode) as fhd:
+        fhd.write(content)
+
+
+def read_file(path, mode='r'):
+    with open(path, mode) as fhd:
+        return fhd.read()
+
+
+def make_package(root):
+    write_file(os.path.join(root, '.pixie.yaml'), 'name: test\n')
+    write_file(os.path.join(root, 'README.md'), 'Hello ${{ fname }}!\n')
+    write_file(os.path.join(root, 'src', 'app.py'), 'print("${{ fname }}")\n')
+    write_file(os.path.join(root, 'assets', 'logo.bin'), bytes(range(256)) * 64, 'wb')
+    write_file(os.path.join(root, '.git', 'config'), '[core]\n')
+
+
+def run_fetch(tmp_path, options):
+    package_dir = str(tmp_path / 'package')
+    target_dir = str(tmp_path / 'target')
+    make_package(package_dir)
+    context = PixieContext(
+        fname='john',
+        __package={'path': package_dir},
+        __target=target_dir
+    )
+
+    result = FetchStep().run(context, options, PixieRuntime(None))
+    return package_dir, target_dir, result
+
+
+def test_fetch_renders_and_copies(tmp_path):
+    package_dir, target_dir, _ = run_fetch(tmp_path, {
+        'templates': [{'path': '*.md'}]
+    })
+
+    assert read_file(os.path.join(target_dir, 'README.md')) == 'Hello john!\n'
+    assert read_file(os.path.join(target_dir, 'src', 'app.py')) == 'print("${{ fname }}")\n'
+    assert read_file(os.path.join(target_dir, 'assets', 'logo.bin'), 'rb') == bytes(range(256)) * 64
+    assert not os.path.exists(os.path.join(target_dir, '.git'))
+    assert not os.path.exists(os.path.join(target_dir, '.pixie.yaml'))
+
+
+def test_fetch_parallel(tmp_path):
+    _, target_dir, _ = run_fetch(tmp_path, {
+        'templates': [{'path': '*.md'}, {'path': 'src/*'}],
+        'parallel': 4
+    })
+
+    assert read_file(os.path.join(target_dir, 'README.md')) == 'Hello john!\n'
+    assert read_file(os.path.join(target_dir, 'src', 'app.py')) == 'print("john")\n'
+
+
+def test_glob_matcher():
+    matcher = GlobMatcher(['*.md', 'src/*', '.git', '.git/*'])
+
+    assert matcher.match('README.md') == 0
+    assert matcher.match('src/app.py') == 1
+    assert matcher.match('.git') == 2
+    assert matcher.match('setup.py') is None
+    assert matcher.matches_all_under('.git')
+    assert not matcher.matches_all_under('docs')
+    assert GlobMatcher([]).match('README.md') is None
+
+
+def test_iter_files_prunes_excluded_directories(tmp_path):
+    make_package(str(tmp_path))
+
+    files = list(iter_files(str(tmp_path), '**/*', GlobMatcher(['.git/*'])))
+
+    assert files == ['.pixie.yaml', 'README.md', 'assets/logo.bin', 'src/app.py']
+
+
+def test_fetch_skips_unchanged_files(tmp_path):
+    package_dir, target_dir, result = run_fetch(tmp_path, {
+        'templates': [{'path': '*.md'}]
+    })
+    assert result == {'created': 3, 'updated': 0, 'unchanged': 0}
+
+    readme = os.path.join(target_dir, 'README.md')
+    readme_mtime = os.stat(readme).st_mtime_ns
+    write_file(os.path.join(package_dir, 'src', 'app.py'), 'print("changed")\n')
+
+    context = PixieContext(
+        fname='john',
+        __package={'path': package_dir},
+        __target=target_dir
+    )
+    result = FetchStep().run(context, {'templates': [{'path': '*.md'}]}, PixieRuntime(None))
+
+    assert result == {'created': 0, 'updated': 1, 'unchanged': 2}
+    assert os.stat(readme).st_mtime_ns == readme_mtime
+    assert read_file(os.path.join(target_dir, 'src', 'app.py')) == 'print("changed")\n'
+    assert os.path.exists(os.path.join(target_dir, '.pixie-fetch.json'))
+
+
+def test_fetch_token_files(tmp_path):
+    options = {'templates': [{'path': 'src/*', 'tokens': {'${{ fname }}': 'jane'}}]}
+    _, target_dir, result = run_fetch(tmp_path, options)
+    assert read_file(os.path.join(target_dir, 'src', 'app.py')) == 'print("jane")\n'
+
+    _, _, result = run_fetch(tmp_path, options)
+    assert result['unchanged'] == 3
+
+
+def test_iter_files_does_not_follow_symlinked_directories(tmp_path):
+    os.makedirs(tmp_path / 'a')
+    (tmp_path / 'a' / 'f.txt').write_text('f')
+    os.symlink('..', tmp_path / 'a' / 'loop')
+
+    assert list(iter_files(str(tmp_path), '**/*')) == ['a/f.txt']
@@ -0,0 +1,103 @@
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from pixie import github
+
+
+def make_response(request, status, content=b'', headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = content
+    response.url = request.url
+    response.request = request
+    return response
+
+
+def test_conditional_adapter(monkeypatch):
+    sent = []
+
+    def send(self, request, **kwargs):
+        sent.append(dict(request.headers))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return make_response(request, 304, headers={'X-RateLimit-Remaining': '41'})
+        return make_response(request, 200, b'{"name": "pixie"}', {'ETag': '"v1"', 'X-RateLimit-Remaining': '42'})
+
+    monkeypatch.setattr(HTTPAdapter, 'send', send)
+    github.metrics.reset()
+    session = requests.Session()
+    session.mount('https://', github.ConditionalAdapter(cache=github.EtagCache()))
+
+    assert session.get('https://api.github.com/repos/a/b').json() == {'name': 'pixie'}
+    response = session.get('https://api.github.com/repos/a/b')
+    assert response.status_code == 200
+    assert response.json() == {'name': 'pixie'}
+    assert response.headers['ETag'] == '"v1"'
+    assert sent[1]['If-None-Match'] == '"v1"'
+    assert github.metrics.as_dict() == dict(requests=2, cache_hits=1, rate_limit_remaining=41)
+
+
+def test_read_hosts_is_cached(tmp_path):
+    hosts_file = str(tmp_path / 'hosts.yml')
+    with open(hosts_file, 'w') as fhd:
+        fhd.write('github.com:\n  oauth_token: abc\n')
+
+    assert github.get_host_token('github.com', hosts_file) == 'abc'
+    assert github.read_hosts(hosts_file) is github.read_hosts(hosts_file)
+    assert github.get_host_token('example.com', hosts_file) is None
+    assert github.read_hosts(str(tmp_path / 'missing.yml')) == {}
+
+
+def test_get_client_is_cached():
+    github.clear_clients()
+    try:
+        client = github.get_client('https://api.github.com', 'token')
+        assert github.get_client('https://api.github.com', 'token') is client
+        assert github.get_client('https://api.github.com', 'other') is not client
+        assert client.requester._Requester__connectionClass is github.get_connection_class()
+    finally:
+        github.clear_clients()
+
+
+class FakeRepo:
+    def __init__(self, name):
+        self.name = name
+
+    def create_label(self, label, color='ffffff'):
+        return f'{self.name}:{label}:{color}'
+
+
+class FakeClient:
+    def __init__(self, host):
+        self.host = host
+
+    def get_repo(self, name):
+        if name == 'missing':
+            raise ValueError('not found')
+        return FakeRepo(f'{self.host}/{name}')
+
+
+def test_bulk(monkeypatch):
+    from pixie.context import PixieContext
+    from pixie.plugins import github as github_plugin
+
+    monkeypatch.setattr(github_plugin, 'get_client', lambda base_url, token, pool_size: FakeClient(base_url))
+    step = {
+        'token': 'abc',
+        'parallel': 4,
+        'operations': [
+            {'fn': 'get_repo', 'args': ['org/${{ name }}'], 'then': [
+                {'fn': 'create_label', 'args': ['bug'], 'kwargs': {'color': 'red'}}
+            ]},
+            {'fn': 'get_repo', 'args': ['org/b'], 'host': 'github.example.com'},
+        ]
+    }
+
+    results = github_plugin.GithubStep().bulk(PixieContext(name='a'), step, None)
+    assert results[0] == 'https://api.github.com/org/a:bug:red'
+    assert results[1].name == 'https://github.example.com/api/v3/org/b'
+
+    step['operations'].append({'fn': 'get_repo', 'args': ['missing']})
+    with pytest.raises(ValueError):
+        github_plugin.GithubStep().bulk(PixieContext(name='a'), step, None)
@@ -0,0 +1,90 @@
+import os
+
+from git import Actor, Repo
+
+from pixie import packages
+from pixie.packages import PixiePackageCache, parse_package
+
+
+def commit_file(repo: Repo, name, content):
+    path = os.path.join(repo.working_tree_dir, name)
+    with open(path, 'w') as fhd:
+        fhd.write(content)
+    repo.index.add([name])
+    author = Actor('pixie', 'pixie@example.com')
+    return repo.index.commit(f'update {name}', author=author, committer=author)
+
+
+def make_cached_package(tmp_path):
+    origin = Repo.init(tmp_path / 'origin', initial_branch='main')
+    commit_file(origin, '.pixie.yaml', 'name: test\n')
+
+    packages_dir = tmp_path / 'packages'
+    Repo.clone_from(str(tmp_path / 'origin'), str(packages_dir / 'mirrors' / 'github.com' / 'org' / 'repo.git'), mirror=True)
+    return origin, str(packages_dir)
+
+
+def test_parse_package():
+    assert parse_package('org/repo') == ('github.com/org/repo', None)
+    assert parse_package('git.example.com/org/repo@v1') == ('git.example.com/org/repo', 'v1')
+
+
+def test_fetch_pulls_stale_package(tmp_path):
+    origin, packages_dir = make_cached_package(tmp_path)
+    latest = commit_file(origin, 'README.md', 'updated\n')
+
+    cache = PixiePackageCache(packages_dir, ttl=60)
+    pkg_dir, base_url = cache.fetch('org/repo')
+
+    assert pkg_dir == cache.get_tree_dir(latest.hexsha)
+    with open(os.path.join(pkg_dir, 'README.md')) as fhd:
+        assert fhd.read() == 'updated\n'
+    assert base_url.endswith('/origin/blob/main/')
+
+    mirror_dir = cache.get_mirror_dir('github.com/org/repo')
+    assert cache.read_metadata(mirror_dir)['commits'] == {'org/repo': latest.hexsha}
+
+
+def test_fetch_uses_fresh_package(tmp_path):
+    origin, packages_dir = make_cached_package(tmp_path)
+
+    cache = PixiePackageCache(packages_dir, ttl=60)
+    cached_dir, _ = cache.fetch('org/repo')
+
+    commit_file(origin, 'README.md', 'updated\n')
+    assert cache.fetch('org/repo')[0] == cached_dir
+
+    # a new process
+    packages._fetched_mirrors.clear()
+    refreshed_dir, _ = PixiePackageCache(packages_dir, ttl=60, refresh=True).fetch('org/repo')
+    assert refreshed_dir != cached_dir
+
+
+def test_fetch_versions_share_objects(tmp_path):
+    origin, packages_dir = make_cached_package(tmp_path)
+    origin.create_tag('v1')
+    commit_file(origin, 'README.md', 'updated\n')
+
+    cache = PixiePackageCache(packages_dir, ttl=60, refresh=True)
+    latest_dir, _ = cache.fetch('org/repo')
+
+    offline = PixiePackageCache(packages_dir, offline=True)
+    v1_dir, base_url = offline.fetch('org/repo@v1')
+
+    assert v1_dir != latest_dir
+    assert not os.path.exists(os.path.join(v1_dir, 'README.md'))
+    assert base_url.endswith('/origin/blob/v1/')
+
+    v1_stat = os.stat(os.path.join(v1_dir, '.pixie.yaml'))
+    latest_stat = os.stat(os.path.join(latest_dir, '.pixie.yaml'))
+    assert v1_stat.st_ino == latest_stat.st_ino
+
+
+def test_fetch_offline_requires_cached_package(tmp_path):
+    cache = PixiePackageCache(str(tmp_path), offline=True)
+
+    try:
+        cache.fetch('org/missing')
+        assert False, 'expected offline fetch to fail'
+    except RuntimeError as ex:
+        assert str(ex) == 'package org/missing is not cached and offline mode is enabled'
@@ -0,0 +1,26 @@
+from pixie.plugin import PixiePluginContext
+from pixie.plugins import PLUGIN_MANIFEST, find_plugins, get_plugin_names
+from pixie.plugins.log import PrintStep
+
+
+def test_manifest_covers_plugins():
+    assert set(PLUGIN_MANIFEST.values()) == set(get_plugin_names())
+
+
+def test_find_plugins():
+    assert find_plugins('print') == ['log']
+    assert find_plugins('unknown') == []
+
+
+def test_get_step_loads_plugin():
+    assert isinstance(PixiePluginContext().get_step('print'), PrintStep)
+    assert PixiePluginContext().get_step('unknown') is None
+
+
+def test_get_step_from_separate_contexts():
+    first, second = PixiePluginContext(), PixiePluginContext()
+
+    step = first.get_step('print')
+    assert second.steps == {}
+    assert second.get_step('print') is step
+    assert 'dump' in second.steps
@@ -1,3 +1,5 @@
+import os
+
 from pixie import rendering
 from pixie.context import PixieContext
 
@@ -27,4 +29,84 @@ def test_render_options():
 def test_render_token():
     assert rendering.render_tokens('test: FNAME', PixieContext({
         'FNAME': 'john'
-    })) == 'test: john'
\ No newline at end of file
+    })) == 'test: john'
+
+def test_render_tokens_single_pass():
+    assert rendering.render_tokens('A AB B', {'A': 'B', 'AB': 'x', 'B': 'A', '': 'y'}) == 'B x A'
+
+
+def test_token_replacer_streams_across_chunks():
+    from io import StringIO
+
+    tokens = {'@@NAME@@': 'john', '@@N@@': 1}
+    content = ('x@@NAME@@y@@N@@' * 50) + '@@NAME'
+    target = StringIO()
+    rendering.TokenReplacer(tokens).stream(StringIO(content), target, chunk_size=7)
+    assert target.getvalue() == rendering.render_tokens(content, tokens) == ('xjohny1' * 50) + '@@NAME'
+
+
+def test_render_value_reuses_compiled_template():
+    rendering.clear_template_cache()
+    context = PixieContext({
+        'fname': 'john',
+    })
+
+    assert rendering.render_value('${{ fname }}', context) == 'john'
+    assert rendering.render_value('${{ fname }}', context) == 'john'
+
+    info = rendering.template_cache_info()
+    assert info['templates'].misses == 1
+    assert info['templates'].hits == 1
+    assert info['environments'].currsize == 1
+
+
+def test_render_options_skips_literals():
+    rendering.clear_template_cache()
+
+    opts = rendering.render_options({
+        'format': 'yaml',
+        'port': '8080',
+        'path': 'src/main.py',
+        'name': '${{ fname }}'
+    }, PixieContext({
+        'fname': 'john',
+    }))
+
+    assert opts == {
+        'format': 'yaml',
+        'port': 8080,
+        'path': 'src/main.py',
+        'name': 'john'
+    }
+    assert rendering.template_cache_info()['templates'].currsize == 1
+
+
+def test_package_environment_resolves_relative_includes(tmp_path):
+    os.makedirs(tmp_path / 'sub')
+    (tmp_path / 'macros.j2').write_text('top')
+    (tmp_path / 'sub' / 'macros.j2').write_text('sub')
+    (tmp_path / 'sub' / 'a.txt').write_text('{% include "macros.j2" %} ${{ name }}')
+    (tmp_path / 'b.txt').write_text('{% include "macros.j2" %}')
+    os.makedirs(tmp_path / 'sub' / 'partials')
+    (tmp_path / 'sub' / 'partials' / 'p.j2').write_text('{% include "macros.j2" %}')
+    (tmp_path / 'sub' / 'c.txt').write_text('{% include "partials/p.j2" %}')
+
+    context = PixieContext(name='x')
+    assert rendering.render_package_file('sub/a.txt', context, str(tmp_path)) == 'sub x'
+    assert rendering.render_package_file('b.txt', context, str(tmp_path)) == 'top'
+    # nested includes resolve against the rendered file's directory
+    assert rendering.render_package_file('sub/c.txt', context, str(tmp_path)) == 'sub'
+    assert rendering.get_environment('package', str(tmp_path)) is rendering.get_environment('package', str(tmp_path))
+
+
+def test_bytecode_cache(tmp_path):
+    package_dir = tmp_path / 'package'
+    os.makedirs(package_dir)
+    (package_dir / 'a.txt').write_text('${{ name }}')
+
+    rendering.set_bytecode_cache(str(tmp_path / 'cache'))
+    try:
+        assert rendering.render_package_file('a.txt', PixieContext(name='x'), str(package_dir)) == 'x'
+        assert os.listdir(tmp_path / 'cache')
+    finally:
+        rendering.set_bytecode_cache(None)
@@ -0,0 +1,45 @@
+import os
+from unittest.mock import patch
+
+from pixie import scripts
+
+
+def write_script(path, content):
+    with open(path, 'w') as fhd:
+        fhd.write(content)
+
+
+def test_load_script_reuses_parse(tmp_path):
+    path = str(tmp_path / '.pixie.yaml')
+    write_script(path, 'name: test\njobs: {}\n')
+
+    with patch('pixie.scripts.parse_script', wraps=scripts.parse_script) as parse_script:
+        first = scripts.load_script(path)
+        first['name'] = 'changed'
+        second = scripts.load_script(path)
+
+    assert parse_script.call_count == 1
+    assert second == {'name': 'test', 'jobs': {}}
+
+
+def test_load_script_reparses_changed_file(tmp_path):
+    path = str(tmp_path / '.pixie.yaml')
+    write_script(path, 'name: test\n')
+    assert scripts.load_script(path) == {'name': 'test'}
+
+    write_script(path, 'name: changed\n')
+    assert scripts.load_script(path) == {'name': 'changed'}
+
+
+def test_load_script_disk_cache(tmp_path):
+    path = str(tmp_path / '.pixie.yaml')
+    cache_dir = str(tmp_path / 'cache')
+    write_script(path, 'name: test\n')
+
+    scripts.load_script(path, cache_dir)
+    scripts._scripts.clear()
+
+    with patch('pixie.scripts.parse_script') as parse_script:
+        assert scripts.load_script(path, cache_dir) == {'name': 'test'}
+    parse_script.assert_not_called()
+    assert len(os.listdir(cache_dir)) == 1
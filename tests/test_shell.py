@@ -0,0 +1,56 @@
+import subprocess
+
+import pytest
+
+from pixie.context import PixieContext
+from pixie.plugins.shell import ShellStep
+from pixie.shell import OutputCapture, ShellSession, run_command
+
+
+def test_shell_session_keeps_state(tmp_path, capsys):
+    (tmp_path / 'sub').mkdir()
+    session = ShellSession(str(tmp_path))
+    try:
+        session.run('NAME=john\ncd sub', setup='TERM_RED=red')
+        session.run('printf "%s " "$NAME" "$(basename "$PWD")" "$TERM_RED"', setup='TERM_RED=ignored')
+        session.run('echo done', cwd=str(tmp_path))
+    finally:
+        session.close()
+
+    assert capsys.readouterr().out == 'john sub red done\n'
+
+
+def test_shell_session_restarts_after_failure(tmp_path, capsys):
+    session = ShellSession(str(tmp_path))
+    try:
+        session.run('NAME=john')
+        with pytest.raises(subprocess.CalledProcessError) as ex:
+            session.run('false\necho unreachable')
+        assert ex.value.returncode == 1
+        session.run('echo "after ${NAME:-reset}"')
+    finally:
+        session.close()
+
+    assert capsys.readouterr().out == 'after reset\n'
+
+
+def test_output_capture_keeps_last_lines(capsys):
+    output = OutputCapture(max_lines=2)
+    run_command('seq 1 5', output=output)
+
+    assert output.getvalue() == '4\n5\n'
+    assert output.dropped == 3
+    assert capsys.readouterr().out == '1\n2\n3\n4\n5\n'
+
+
+def test_shell_step_capture(tmp_path):
+    context = PixieContext(__target=str(tmp_path))
+
+    assert ShellStep().run(context, {'command': 'echo hello', 'capture': True, 'echo': False}, None) == 'hello'
+    assert ShellStep().run(context, {'command': 'echo \'{"a": 1}\'', 'json': True, 'echo': False}, None) == {'a': 1}
+
+    session = context['__shell'] = ShellSession(str(tmp_path))
+    try:
+        assert ShellStep().run(context, {'command': 'echo persistent', 'capture': True, 'echo': False}, None) == 'persistent'
+    finally:
+        session.close()
@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+import tests
+
+
+def test_cli_startup_budget(tmp_path):
+    script = os.path.join(os.path.dirname(tests.tests_dir), 'benchmarks', 'importtime.py')
+    # the completion scenario writes its cache below ~/.pixie
+    env = dict(os.environ, HOME=str(tmp_path))
+
+    proc = subprocess.run([sys.executable, script, '--check'], capture_output=True, text=True, env=env)
+
+    assert proc.returncode == 0, proc.stdout + proc.stderr
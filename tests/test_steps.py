@@ -0,0 +1,205 @@
+import sys
+from unittest.mock import patch
+
+from pixie.context import PixieContext
+from pixie.runtime import PixieRuntime
+from pixie import steps
+from pixie.steps import PixieStep, PixieStepExecution, PixieStepPlan
+
+
+class RecordStep(PixieStep):
+    def __init__(self) -> None:
+        self.messages = []
+
+    def run(self, context: PixieContext, step: dict, runtime: PixieRuntime):
+        self.messages.append(step['message'])
+        return step['message']
+
+
+class PluginContext:
+    def __init__(self, **steps) -> None:
+        self.steps = steps
+
+    def get_step(self, step_name: str):
+        return self.steps.get(step_name)
+
+
+def test_compile_plan():
+    record = RecordStep()
+    execution = PixieStepExecution(PluginContext(log=record))
+
+    plan = execution.compile([
+        {'id': 'hello', 'log': 'hello'},
+        {'id': 'items', 'foreach': {
+            'items': '${{ [1, 2, 3] }}',
+            'item_name': 'item',
+            'steps': [{'log': 'item'}]
+        }}
+    ])
+
+    assert isinstance(plan, PixieStepPlan)
+    assert plan[0].action == 'log'
+    assert plan[0].executor == record.run
+    assert plan[1].kind == 'foreach'
+    assert plan[1].children[0].action == 'log'
+
+
+def test_execute_plan_normalizes_once():
+    record = RecordStep()
+    execution = PixieStepExecution(PluginContext(log=record))
+    context = PixieContext()
+
+    plan = execution.compile([
+        {'id': 'items', 'foreach': {
+            'items': '${{ [1, 2, 3] }}',
+            'item_name': 'item',
+            'steps': [{'log': 'item', 'if': '${{ item != 2 }}'}]
+        }}
+    ])
+
+    with patch.object(execution, 'normalize_step') as normalize_step:
+        execution.execute(context, PixieRuntime(None), context['steps'], plan)
+
+    normalize_step.assert_not_called()
+    assert record.messages == ['item', 'item']
+    assert context['item'] == 3
+
+
+def test_template_errors_only_raise_when_a_step_runs():
+    record = RecordStep()
+    execution = PixieStepExecution(PluginContext(log=record))
+    calls = []
+    context = PixieContext(calls=calls)
+
+    plan = execution.compile([
+        {'if': '${{ false }}', 'action': 'calls:append', 'with': {'args': ['n=${#arr[@]}']}},
+        {'on_error': 'ignore', 'action': 'calls:append', 'with': {'args': ['n=${#arr[@]}']}},
+        {'log': 'n=${#arr[@]}'},
+        {'action': 'calls:append', 'with': {'args': ['done']}},
+    ])
+    execution.execute(context, PixieRuntime(None), context['steps'], plan)
+
+    assert plan[2].options is None
+    assert record.messages == ['n=${#arr[@]}']
+    assert calls == ['done']
+
+
+def test_parallel_foreach_collects_results_in_order():
+    record = RecordStep()
+    execution = PixieStepExecution(PluginContext(log=record))
+    context = PixieContext()
+
+    execution.execute(context, PixieRuntime(None), context['steps'], [
+        {'id': 'items', 'foreach': {
+            'items': '${{ range(8) | list }}',
+            'item_name': 'item',
+            'parallel': 4,
+            'steps': [{'id': 'message', 'log': 'item ${{ item }}'}]
+        }}
+    ])
+
+    assert [r['items'] for r in context['steps']['items']] == list(range(8))
+    assert [r['message'] for r in context['steps']['items']] == ['item ${{ item }}'] * 8
+    assert 'item' not in context
+
+
+def test_parallel_foreach_orders_stdout(capsys):
+    from pixie.plugins.shell import ShellStep
+    from pixie.rendering import render_value
+
+    class PrintStep(PixieStep):
+        def run(self, context: PixieContext, step: dict, runtime: PixieRuntime):
+            print(render_value(step['message'], context))
+
+    execution = PixieStepExecution(PluginContext(print=PrintStep(), shell=ShellStep()))
+    context = PixieContext(__target='.')
+
+    execution.execute(context, PixieRuntime(None), context['steps'], [
+        {'foreach': {
+            'items': [3, 2, 1, 0],
+            'item_name': 'item',
+            'parallel': 4,
+            'steps': [
+                {'print': 'start ${{ item }}'},
+                {'run': 'sleep 0.${{ item }}; echo "end ${{ item }}"'}
+            ]
+        }}
+    ])
+
+    assert capsys.readouterr().out.split() == [
+        'start', '3', 'end', '3', 'start', '2', 'end', '2', 'start', '1', 'end', '1', 'start', '0', 'end', '0'
+    ]
+
+
+def test_parallel_foreach_collect_all_errors():
+    class FailStep(PixieStep):
+        def run(self, context: PixieContext, step: dict, runtime: PixieRuntime):
+            if context['item'] % 2:
+                raise ValueError(context['item'])
+            return context['item']
+
+    execution = PixieStepExecution(PluginContext(fail=FailStep()))
+    context = PixieContext()
+
+    try:
+        execution.execute(context, PixieRuntime(None), context['steps'], [
+            {'id': 'items', 'foreach': {
+                'items': [0, 1, 2, 3],
+                'item_name': 'item',
+                'parallel': 2,
+                'fail_fast': False,
+                'steps': [{'id': 'value', 'action': 'fail'}]
+            }}
+        ])
+        assert False, 'expected foreach to fail'
+    except RuntimeError as ex:
+        assert str(ex) == '2 of 4 iterations failed in items'
+
+    results = context['steps']['items']
+    assert results[0]['value'] == 0
+    assert results[1] == {'error': '1'}
+    assert results[2]['value'] == 2
+
+
+def test_execute_graph_runs_needs_first():
+    class WaitStep(PixieStep):
+        def run(self, context: PixieContext, step: dict, runtime: PixieRuntime):
+            return dict(context['steps'])
+
+    execution = PixieStepExecution(PluginContext(snapshot=WaitStep()))
+    context = PixieContext()
+
+    execution.execute_graph(context, PixieRuntime(None), context['steps'], [
+        {'id': 'last', 'action': 'snapshot', 'needs': ['a', 'b']},
+        {'id': 'a', 'action': 'snapshot'},
+        {'id': 'b', 'action': 'snapshot', 'needs': 'a'},
+    ], parallel=4)
+
+    assert set(context['steps']['last']) == {'a', 'b'}
+    assert set(context['steps']['b']) == {'a'}
+
+
+def test_execute_graph_unknown_need():
+    execution = PixieStepExecution(PluginContext())
+    context = PixieContext()
+
+    try:
+        execution.execute_graph(context, PixieRuntime(None), context['steps'], [
+            {'id': 'a', 'log': 'a', 'needs': ['missing']},
+        ])
+        assert False, 'expected unknown need to fail'
+    except ValueError as ex:
+        assert str(ex) == 'step a needs unknown step missing'
+
+
+def test_stdout_buffering_is_removed_after_overlapping_steps():
+    stdout = sys.stdout
+
+    steps.install_stdout_buffering()
+    steps.install_stdout_buffering()
+    assert isinstance(sys.stdout, steps.BufferedStdout)
+    assert sys.stdout.stream is stdout
+    steps.release_stdout_buffering()
+    assert isinstance(sys.stdout, steps.BufferedStdout)
+    steps.release_stdout_buffering()
+    assert sys.stdout is stdout
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from pixie import utils
+
+
+def test_run_parallel_fail_fast():
+    def fn(index):
+        if index == 1:
+            raise ValueError('failed')
+        return index
+
+    results, errors = utils.run_parallel(fn, 4, 1)
+
+    assert results == [0, {'error': 'failed'}, None, None]
+    assert list(errors) == [1]
+    with pytest.raises(ValueError):
+        utils.raise_errors(errors, 4, 'calls failed')
+
+
+def test_run_parallel_collects_every_error():
+    done = []
+
+    def fn(index):
+        if index % 2:
+            raise ValueError(index)
+        return index
+
+    results, errors = utils.run_parallel(fn, 4, 2, fail_fast=False, on_done=done.append)
+
+    assert results == [0, {'error': '1'}, 2, {'error': '3'}]
+    assert done == [0, 1, 2, 3]
+    with pytest.raises(RuntimeError, match='2 of 4 calls failed') as info:
+        utils.raise_errors(errors, 4, 'calls failed')
+    assert str(info.value.__cause__) == '1'
+
+
+def test_write_atomic(tmp_path):
+    path = str(tmp_path / 'cache' / 'data.json')
+
+    utils.write_atomic(path, lambda fhd: fhd.write('{}'))
+    with open(path) as fhd:
+        assert fhd.read() == '{}'
+
+    def fail(fhd):
+        fhd.write('partial')
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        utils.write_atomic(path, fail)
+    with open(path) as fhd:
+        assert fhd.read() == '{}'
+    assert os.listdir(tmp_path / 'cache') == ['data.json']